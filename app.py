@@ -1,23 +1,59 @@
-from flask import Flask, jsonify, redirect, request, session, url_for
+from flask import Flask, Response, g, jsonify, redirect, request, session, stream_with_context, url_for
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from dotenv import load_dotenv
 from urllib.parse import urlencode
 from spotify import spotify  # This imports the blueprint
-from nlp_processor import MusicNLPProcessor
+from nlp_processor import MusicNLPProcessor, VOCABULARY_PATH
+from sentiment import get_sentiment_backend
+from catalog import GENRE_COLUMNS, GenreCatalog, decode_cursor, encode_cursor
+from json_provider import FastJSONProvider, stream_json_array, stream_ndjson
+from compression import ResponseCompressor
+from db_pool import engine_options_from_env, pool_stats
+from metrics import metrics
+from profiling import RequestProfiler, SamplingProfiler
 import os
 import time
+import hashlib
+import hmac
 import requests
 import random
-
-# Initialize NLP processor
-nlp_processor = MusicNLPProcessor()
+from functools import wraps
 
 # Load environment variables
 load_dotenv()
 
+# Initialize NLP processor
+nlp_ttl = os.getenv("NLP_CACHE_TTL")
+nlp_processor = MusicNLPProcessor(
+    cache_size=int(os.getenv("NLP_CACHE_SIZE", 1024)),
+    cache_ttl=float(nlp_ttl) if nlp_ttl else None,
+    sentiment_backend=get_sentiment_backend(os.getenv("NLP_SENTIMENT_BACKEND", "textblob")),
+    # Each worker polls the vocabulary file for changes at most this often (0 disables)
+    watch_interval=float(os.getenv("NLP_VOCABULARY_WATCH_SECONDS", 5)),
+    vocabulary_path=os.getenv("NLP_VOCABULARY_PATH", VOCABULARY_PATH),
+    stage_timer=metrics.stage,
+)
+
+# Optionally pay the TextBlob import/lexicon cost at boot instead of on the first fallback
+if os.getenv("NLP_WARM_UP", "").lower() in ("1", "true", "yes"):
+    nlp_processor.warm_up()
+
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+
+# Per-route latency histograms at /metrics; METRICS_SERVER_TIMING=1 adds a Server-Timing header
+metrics.init_app(app, server_timing=os.getenv("METRICS_SERVER_TIMING", "").lower() in ("1", "true", "yes"))
+
+# gzip/brotli for JSON bodies; catalog responses also keep their compressed bytes cached
+compressor = ResponseCompressor(
+    app,
+    min_size=int(os.getenv("COMPRESS_MIN_SIZE", 1024)),
+    gzip_level=int(os.getenv("COMPRESS_GZIP_LEVEL", 6)),
+    brotli_quality=int(os.getenv("COMPRESS_BROTLI_QUALITY", 4)),
+    cache_bytes=int(os.getenv("COMPRESS_CACHE_BYTES", 32 * 1024 * 1024)),
+)
 
 # CORRECT ORDER
 CORS(
@@ -37,6 +73,8 @@ app.register_blueprint(spotify)
 # Database Configuration
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URI")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# Pool size/overflow/recycle/pre-ping per worker, from the DB_POOL_* env vars
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options_from_env(app.config["SQLALCHEMY_DATABASE_URI"])
 
 # Soptify Configuration
 # Spotify Token Gen SEC
@@ -48,9 +86,51 @@ app.secret_key = os.getenv("FLASK_SECRET_KEY")
 # Add just below app.secret_key
 app.config.update(SESSION_COOKIE_SAMESITE="None", SESSION_COOKIE_SECURE=True)
 
+# Admin endpoints are disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def is_admin_request():
+    """True when the request carries the ADMIN_TOKEN in the X-Admin-Token header"""
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def admin_required(view):
+    """Only allow requests carrying the ADMIN_TOKEN in the X-Admin-Token header"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin_request():
+            return jsonify({"error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# Profiling is opt-in: with PROFILING_ENABLED unset no hooks are registered at all
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+sampler = SamplingProfiler()
+if PROFILING_ENABLED:
+    # An admin request with "X-Profile: cprofile" (or "pstats") gets its own profile back
+    RequestProfiler(app, authorized=is_admin_request)
+
 
 # Initialize Database
 db = SQLAlchemy(app)
+with app.app_context():
+    metrics.instrument_engine(db.engine)
+
+# Rows fetched per server-side cursor batch when streaming GET /songs
+SONGS_STREAM_BATCH = int(os.getenv("SONGS_STREAM_BATCH", 1000))
+
+# Cache-Control sent with catalog responses, so browsers and the CDN can reuse them
+CATALOG_CACHE_CONTROL = os.getenv("CATALOG_CACHE_CONTROL", "public, max-age=60, stale-while-revalidate=300")
+
+# Largest page size /songs/<genre> will serve
+SONGS_PAGE_MAX = int(os.getenv("SONGS_PAGE_MAX", 500))
+
+# Upper bound on messages accepted by /chat/batch
+CHAT_BATCH_MAX = int(os.getenv("CHAT_BATCH_MAX", 1000))
 
 
 # Define Music Table Model
@@ -116,11 +196,99 @@ class Music(db.Model):
         }
 
 
+# Long-format catalog: one row per (genre, song), backfilled from music_recommendations
+# by migrate_catalog.py. position is the id of the source music_recommendations row.
+class CatalogSong(db.Model):
+    __tablename__ = "catalog_songs"
+    __table_args__ = (
+        db.UniqueConstraint("genre", "position", name="uq_catalog_songs_genre_position"),
+        # Lets GET /songs stream rows in (position, genre) order without a sort
+        db.Index("ix_catalog_songs_position_genre", "position", "genre"),
+        {'schema': 'public'},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    genre = db.Column(db.String(50), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    song = db.Column(db.String(100), nullable=False)
+
+
+# Song lookups by genre, served from a per-worker in-memory snapshot refreshed every
+# CATALOG_CACHE_TTL seconds (0 reads straight from the DB)
+catalog = GenreCatalog(
+    db,
+    CatalogSong,
+    GENRE_COLUMNS,
+    ttl=float(os.getenv("CATALOG_CACHE_TTL", 300)),
+    app=app,
+    count_ttl=float(os.getenv("CATALOG_COUNT_TTL", 60)),
+)
+
+
+def catalog_cached(view):
+    """ETag + Cache-Control for catalog GETs, answering If-None-Match with a 304.
+
+    The ETag hashes the catalog version with everything the body depends on
+    (URL with query string, negotiated type), so a revalidation hit skips
+    both the DB and serialization. It is strong when the body comes from the
+    catalog snapshot, whose version hashes its content, and only then are
+    compressed bodies replayed from the compressor's cache. Reads that go to
+    the DB get a weak ETag, as their version token misses in-place updates.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            version, strong = catalog.version_token()
+        except Exception as e:
+            print(f"Catalog version lookup failed, serving uncached: {e}")
+            return view(*args, **kwargs)
+
+        key = "|".join([version, request.url, request.accept_mimetypes.best or ""])
+        etag = hashlib.sha1(key.encode()).hexdigest()
+        encoding = compressor.negotiate()
+        encoded_etag = compressor.variant_etag(etag, encoding)
+        matches = request.if_none_match.contains if strong else request.if_none_match.contains_weak
+        if matches(encoded_etag) or matches(etag):
+            response = app.response_class(status=304)
+            response.set_etag(encoded_etag if matches(encoded_etag) else etag, not strong)
+        else:
+            response = compressor.cached_response(etag, encoding) if strong else None
+            if response is None:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                # A snapshot swap while the view ran means the body may not match the ETag
+                try:
+                    unchanged = catalog.version_token() == (version, strong)
+                except Exception:
+                    unchanged = False
+                if unchanged:
+                    response.set_etag(etag, not strong)
+                    if strong:
+                        g.compressed_cache_key = etag
+        response.headers["Cache-Control"] = CATALOG_CACHE_CONTROL
+        response.vary.add("Accept")
+        return response
+    return wrapper
+
+
 # Route to fetch all songs
 @app.route("/songs", methods=["GET"])
+@catalog_cached
 def get_songs():
-    songs = Music.query.all()
-    return jsonify([song.to_dict() for song in songs])
+    """Stream the whole catalog as a JSON array, or as NDJSON when asked for"""
+    ndjson = (
+        request.args.get("format") == "ndjson"
+        or request.accept_mimetypes.best == "application/x-ndjson"
+    )
+    # Genres without a song are left out of each row unless ?include_nulls=1
+    include_nulls = request.args.get("include_nulls", "").lower() in ("1", "true", "yes")
+    rows = catalog.iter_wide_rows(batch_size=SONGS_STREAM_BATCH, include_nulls=include_nulls)
+    stream = stream_ndjson if ndjson else stream_json_array
+    body = stream(rows, app.json.dumps_bytes)
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+    return Response(stream_with_context(body), mimetype=mimetype)
+
 
 
 # Route to fetch songs by genre
@@ -128,53 +296,22 @@ from flask import request, url_for
 
 
 @app.route("/songs/<genre>", methods=["GET"])
+@catalog_cached
 def get_songs_by_genre(genre):
-    allowed_genres = [
-        "sad_music",
-        "romantic_music",
-        "party_music",
-        "happy_music",
-        "melancholy_music",
-        "focus_music",
-        "instrumental_music",
-        "k_pop_music",
-        "electronic_music",
-        "rnb_music",
-        "blues_music",
-        "personal_fav",
-        "native_music",
-        "classical_music",
-        "workout_music",
-        "rock_music",
-        "rap_music",
-        "pop_music",
-        "jazz_music",
-        "motivational_music",
-        "trending_music",
-        "latest_music",
-        "top_music",
-        "hidden_gems_music",
-        "developers_choice_music",
-    ]
-
-    if genre not in allowed_genres:
+    if genre not in GENRE_COLUMNS:
         return jsonify({"error": "Invalid genre"}), 400
 
-    offset = int(request.args.get("offset", 0))
-    limit = int(request.args.get("limit", 10))
+    # ?cursor= (empty for the first page) switches to keyset pagination
+    if "cursor" in request.args:
+        return get_songs_by_genre_cursor(genre)
 
-    genre_column = getattr(Music, genre)
-    total_items = Music.query.filter(genre_column.isnot(None)).count()
-
-    songs = (
-        Music.query.with_entities(genre_column)
-        .filter(genre_column.isnot(None))
-        .offset(offset)
-        .limit(limit)
-        .all()
-    )
+    try:
+        offset = int_arg("offset", 0, 0)
+        limit = int_arg("limit", 10, 1, SONGS_PAGE_MAX)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    results = [song[0] for song in songs]
+    results, total_items = catalog.genre_page(genre, offset, limit)
 
     next_offset = offset + limit
     prev_offset = max(0, offset - limit)
@@ -200,6 +337,47 @@ def get_songs_by_genre(genre):
         }
     )
 
+
+def int_arg(name, default, minimum, maximum=None):
+    """Integer query parameter, clamped to maximum; ValueError if it is not an integer >= minimum"""
+    raw = request.args.get(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    return min(value, maximum) if maximum is not None else value
+
+
+def get_songs_by_genre_cursor(genre):
+    """Keyset page of a genre: seeks past the cursor instead of scanning an OFFSET"""
+    cursor = request.args.get("cursor", "")
+
+    try:
+        limit = int_arg("limit", 10, 1, SONGS_PAGE_MAX)
+        after_position = decode_cursor(genre, cursor) if cursor else 0
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    results, last_position, has_more = catalog.genre_page_after(genre, after_position, limit)
+    total_items = catalog.genre_count(genre)
+    next_cursor = encode_cursor(genre, last_position) if has_more and last_position is not None else None
+
+    return jsonify(
+        {
+            "results": results,
+            "next_cursor": next_cursor,
+            "total_items": total_items,
+            "has_more": next_cursor is not None,
+            "length": len(results),
+            "next": f"{request.base_url}?cursor={next_cursor}&limit={limit}" if next_cursor else None,
+            "prev": None,
+        }
+    )
+
 @app.route("/chat", methods=["POST"])
 def chat_endpoint():
     """NLP-powered music recommendation chat endpoint"""
@@ -216,21 +394,14 @@ def chat_endpoint():
         # Generate conversational response
         response = nlp_processor.generate_response(analysis, user_message)
         
-        # Get actual songs from database based on recommended genres
+        # Get actual songs from database based on recommended genres, one query for all of them
+        songs_by_genre = catalog.top_songs_by_genre(response['genres'], 5)
         recommended_songs = []
-        for genre in response['genres']:
-            # Query your database for songs in this genre
-            genre_column = getattr(Music, genre, None)
-            if genre_column:
-                songs = Music.query.with_entities(genre_column).filter(
-                    genre_column.isnot(None)
-                ).limit(5).all()
-                
-                genre_songs = [song[0] for song in songs if song[0]]
-                recommended_songs.extend(genre_songs)
+        for genre_songs in songs_by_genre.values():
+            recommended_songs.extend(genre_songs)
         
         # Remove duplicates and limit results
-        unique_songs = list(set(recommended_songs))
+        unique_songs = list(dict.fromkeys(recommended_songs))
         
         return jsonify({
             'bot_message': response['message'],
@@ -248,6 +419,58 @@ def chat_endpoint():
         return jsonify({'error': f'Chat processing failed: {str(e)}'}), 500
 
 
+@app.route("/chat/batch", methods=["POST"])
+def chat_batch_endpoint():
+    """Analyze many chat messages in one request and resolve their songs with one DB query"""
+    try:
+        data = request.get_json()
+        messages = data.get('messages')
+        try:
+            songs_per_genre = int(data.get('songs_per_genre', 5))
+        except (TypeError, ValueError):
+            songs_per_genre = None
+
+        if not isinstance(messages, list) or not messages:
+            return jsonify({'error': 'messages must be a non-empty list'}), 400
+        if len(messages) > CHAT_BATCH_MAX:
+            return jsonify({'error': f'At most {CHAT_BATCH_MAX} messages per batch'}), 400
+        # Each result keeps 10 songs, so more than 10 per genre is never used
+        if songs_per_genre is None or not 1 <= songs_per_genre <= 10:
+            return jsonify({'error': 'songs_per_genre must be an integer from 1 to 10'}), 400
+
+        analyses = list(nlp_processor.process_messages(messages))
+        responses = [
+            nlp_processor.generate_response(analysis, message)
+            for analysis, message in zip(analyses, messages)
+        ]
+
+        # Every genre the batch needs, fetched together
+        needed_genres = [genre for response in responses for genre in response['genres']]
+        songs_by_genre = catalog.top_songs_by_genre(needed_genres, songs_per_genre)
+
+        results = []
+        for analysis, response in zip(analyses, responses):
+            songs = []
+            for genre in response['genres']:
+                songs.extend(songs_by_genre.get(genre, []))
+            results.append({
+                'bot_message': response['message'],
+                'recommended_songs': list(dict.fromkeys(songs))[:10],
+                'genres': response['genres'],
+                'follow_up': response.get('follow_up', ''),
+                'analysis': {
+                    'emotions': analysis['emotions'],
+                    'activities': analysis['activities'],
+                    'confidence': analysis['confidence']
+                }
+            })
+
+        return jsonify({'results': results, 'count': len(results)})
+
+    except Exception as e:
+        return jsonify({'error': f'Batch chat processing failed: {str(e)}'}), 500
+
+
 # Alternative endpoint for getting songs by emotion/mood
 @app.route("/songs/by-mood", methods=["POST"])
 def get_songs_by_mood():
@@ -256,40 +479,117 @@ def get_songs_by_mood():
         data = request.get_json()
         mood_text = data.get('mood', '')
         limit = data.get('limit', 10)
+        # Optional seed makes the sample (and its order) reproducible
+        seed = data.get('seed')
         
         if not mood_text:
             return jsonify({'error': 'Mood text is required'}), 400
+        if seed is not None and not isinstance(seed, (int, str)):
+            return jsonify({'error': 'seed must be an integer or a string'}), 400
         
         # Process mood with NLP
         analysis = nlp_processor.process_user_message(mood_text)
         genres = analysis['recommended_genres']
         
-        # Get songs from recommended genres
+        # Random sample from each recommended genre, not just the head of it
+        songs_by_genre = catalog.sample_songs_by_genre(genres, limit // len(genres) + 2, seed=seed)
         all_songs = []
-        for genre in genres:
-            genre_column = getattr(Music, genre, None)
-            if genre_column:
-                songs = Music.query.with_entities(genre_column).filter(
-                    genre_column.isnot(None)
-                ).limit(limit // len(genres) + 2).all()
-                
-                genre_songs = [song[0] for song in songs if song[0]]
-                all_songs.extend(genre_songs)
+        for genre_songs in songs_by_genre.values():
+            all_songs.extend(genre_songs)
         
         # Remove duplicates and shuffle
-        unique_songs = list(set(all_songs))
-        random.shuffle(unique_songs)
+        unique_songs = list(dict.fromkeys(all_songs))
+        random.Random(seed).shuffle(unique_songs)
         
-        return jsonify({
+        response = {
             'songs': unique_songs[:limit],
             'detected_emotions': analysis['emotions'],
             'confidence': analysis['confidence'],
             'recommended_genres': genres
-        })
+        }
+        if seed is not None:
+            response['seed'] = seed
+        return jsonify(response)
     
     except Exception as e:
         return jsonify({'error': f'Mood analysis failed: {str(e)}'}), 500
 
+@app.route("/admin/nlp", methods=["GET"])
+@admin_required
+def nlp_status():
+    """Current vocabulary version, compile stats and NLP cache counters"""
+    return jsonify(nlp_processor.vocabulary_info())
+
+
+@app.route("/admin/nlp/reload", methods=["POST"])
+@admin_required
+def reload_nlp_vocabulary():
+    """Reload the NLP vocabulary file in this worker and report compile time"""
+    try:
+        return jsonify(nlp_processor.reload_vocabulary())
+    except (OSError, ValueError) as e:
+        return jsonify({"error": f"Vocabulary reload failed: {str(e)}"}), 400
+
+@app.route("/admin/catalog", methods=["GET"])
+@admin_required
+def catalog_status():
+    """Age, size and refresh counters of this worker's catalog snapshot and response cache"""
+    return jsonify(dict(catalog.stats(), compressed_responses=compressor.cache.stats()))
+
+
+@app.route("/admin/catalog/invalidate", methods=["POST"])
+@admin_required
+def invalidate_catalog():
+    """Drop this worker's catalog snapshot and compressed responses and reload from the DB"""
+    compressor.cache.clear()
+    try:
+        catalog.invalidate()
+    except Exception as e:
+        return jsonify({"error": f"Catalog reload failed: {str(e)}"}), 500
+    return jsonify(catalog.stats())
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """This worker's request and stage metrics in Prometheus text format"""
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/admin/profile", methods=["POST"])
+@admin_required
+def start_profile():
+    """Sample every thread of this worker for ?seconds=N at ?interval_ms=M in the background"""
+    if not PROFILING_ENABLED:
+        return jsonify({"error": "Profiling is disabled"}), 404
+    try:
+        seconds = min(float(request.args.get("seconds", 10)), PROFILE_MAX_SECONDS)
+        interval = max(float(request.args.get("interval_ms", 5)), 1) / 1000
+    except ValueError:
+        return jsonify({"error": "seconds and interval_ms must be numbers"}), 400
+    if not sampler.start(seconds, interval):
+        return jsonify({"error": "A profile is already running", **sampler.status()}), 409
+    return jsonify(sampler.status()), 202
+
+
+@app.route("/admin/profile", methods=["GET"])
+@admin_required
+def get_profile_result():
+    """Collapsed stacks of this worker's last finished sampling session, for flamegraph tools"""
+    if not PROFILING_ENABLED:
+        return jsonify({"error": "Profiling is disabled"}), 404
+    if sampler.running or sampler.result is None:
+        return jsonify(sampler.status()), 202
+    response = Response(sampler.result, mimetype="text/plain")
+    response.headers["X-Profile-Pid"] = str(os.getpid())
+    return response
+
+
+@app.route("/admin/db/pool", methods=["GET"])
+@admin_required
+def db_pool_status():
+    """This worker's connection pool settings, usage and checkout wait times"""
+    return jsonify(pool_stats(db.engine))
+
+
 # Run the Flask app
 if __name__ == "__main__":
     print("Flask app is starting...")
@@ -0,0 +1,128 @@
+"""Compare the old and new GET /songs read paths on a local SQLite database.
+
+old: hydrate every wide Music row through the ORM, build a 26-key dict per row
+     with every NULL included, and encode with Flask's default JSON provider.
+new: select (position, genre, song) tuples from catalog_songs in server-side
+     batches, drop NULLs, and encode with FastJSONProvider (orjson when installed).
+
+    python benchmarks/bench_catalog_serialize.py --sizes 1000 10000 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from flask_sqlalchemy import SQLAlchemy
+
+from common import REPO_ROOT  # noqa: F401  (puts the repo root on sys.path)
+from catalog import GENRE_COLUMNS, GenreCatalog
+from json_provider import FastJSONProvider, orjson, stream_json_array
+
+
+def build_app(path):
+    """Flask app with the wide and long catalog tables on a SQLite file"""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+    db = SQLAlchemy(app)
+
+    columns = {genre: db.Column(db.String(100)) for genre in GENRE_COLUMNS}
+    Wide = type("Wide", (db.Model,), {
+        "__tablename__": "music_recommendations",
+        "id": db.Column(db.Integer, primary_key=True),
+        **columns,
+    })
+    Song = type("Song", (db.Model,), {
+        "__tablename__": "catalog_songs",
+        "__table_args__": (db.UniqueConstraint("genre", "position"), db.Index("ix_position_genre", "position", "genre")),
+        "id": db.Column(db.Integer, primary_key=True),
+        "genre": db.Column(db.String(50), nullable=False),
+        "position": db.Column(db.Integer, nullable=False),
+        "song": db.Column(db.String(100), nullable=False),
+    })
+    return app, db, Wide, Song
+
+
+def populate(db, Wide, Song, rows, fill, seed):
+    """Insert `rows` wide rows with roughly `fill` of the genre cells set, plus their long-format copy"""
+    rng = random.Random(seed)
+    wide = []
+    long = []
+    for position in range(1, rows + 1):
+        row = {"id": position}
+        for genre in GENRE_COLUMNS:
+            song = f"{genre} song {position}" if rng.random() < fill else None
+            row[genre] = song
+            if song is not None:
+                long.append({"genre": genre, "position": position, "song": song})
+        wide.append(row)
+    db.session.execute(db.insert(Wide), wide)
+    db.session.execute(db.insert(Song), long)
+    db.session.commit()
+    return len(long)
+
+
+def old_path(db, Wide, provider):
+    records = [
+        {"id": row.id, **{genre: getattr(row, genre) for genre in GENRE_COLUMNS}}
+        for row in Wide.query.all()
+    ]
+    body = provider.dumps(records).encode()
+    db.session.expunge_all()
+    return body
+
+
+def new_path(catalog, provider):
+    return b"".join(stream_json_array(catalog.iter_wide_rows(), provider.dumps_bytes))
+
+
+def measure(func, repeat):
+    """Best wall time over `repeat` runs, then peak traced memory of one extra run"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--fill", type=float, default=0.3, help="share of genre cells that hold a song")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"encoder: {'orjson' if orjson else 'stdlib json'}; fill {args.fill:.0%}")
+    print(f"{'rows':>8}{'path':>6}{'time ms':>12}{'peak MiB':>11}{'body KiB':>11}{'speedup':>9}")
+    for rows in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            app, db, Wide, Song = build_app(os.path.join(tmp, "bench.db"))
+            with app.app_context():
+                db.create_all()
+                populate(db, Wide, Song, rows, args.fill, args.seed)
+                default_provider = DefaultJSONProvider(app)
+                default_provider.compact = True
+                fast_provider = FastJSONProvider(app)
+                catalog = GenreCatalog(db, Song, GENRE_COLUMNS, ttl=0)
+
+                old = measure(lambda: old_path(db, Wide, default_provider), args.repeat)
+                new = measure(lambda: new_path(catalog, fast_provider), args.repeat)
+                for name, (seconds, peak, size) in (("old", old), ("new", new)):
+                    speedup = f"{old[0] / seconds:.1f}x" if name == "new" else ""
+                    print(
+                        f"{rows:>8}{name:>6}{seconds * 1000:>12.1f}{peak / 2**20:>11.1f}"
+                        f"{size / 1024:>11.0f}{speedup:>9}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Per-stage microbenchmark for the MusicNLPProcessor recommendation path.
+
+Runs a synthetic chat corpus through each stage for every (message length,
+hit ratio) scenario and reports latency percentiles and throughput. Reports
+can be written as JSON and compared against an earlier run:
+
+    python benchmarks/bench_nlp.py --json before.json
+    python benchmarks/bench_nlp.py --json after.json --compare before.json
+"""
+import argparse
+import sys
+import time
+
+from common import (
+    compare_reports,
+    load_report,
+    make_chat_corpus,
+    print_table,
+    run_metadata,
+    summarize,
+    time_calls,
+    write_report,
+)
+from nlp_processor import MusicNLPProcessor
+from sentiment import get_sentiment_backend
+
+
+def bench_scenario(messages, sentiment):
+    """Time every stage of the NLP path over one corpus"""
+    # cache_size=0 so every stage does its full work on every message
+    processor = MusicNLPProcessor(cache_size=0, sentiment_backend=get_sentiment_backend(sentiment))
+    processor.warm_up()
+
+    analyses = [processor.process_user_message(message) for message in messages]
+    emotions = [processor.extract_emotions(message) for message in messages]
+    activities = [processor.extract_activities(message) for message in messages]
+
+    stages = {
+        "preprocess_text": (processor.preprocess_text, [(m,) for m in messages]),
+        "extract_emotions": (processor.extract_emotions, [(m,) for m in messages]),
+        "extract_activities": (processor.extract_activities, [(m,) for m in messages]),
+        "get_genre_recommendations": (
+            processor.get_genre_recommendations, list(zip(emotions, activities))
+        ),
+        "generate_response": (processor.generate_response, [(a, m) for a, m in zip(analyses, messages)]),
+        "process_user_message": (processor.process_user_message, [(m,) for m in messages]),
+    }
+    results = {name: summarize(time_calls(func, args)) for name, (func, args) in stages.items()}
+
+    # Same corpus with the result cache on: the first pass fills it, the second is timed
+    cached = MusicNLPProcessor(cache_size=len(messages) + 1, sentiment_backend=processor.sentiment_backend)
+    for message in messages:
+        cached.process_user_message(message)
+    results["process_user_message_cached"] = summarize(
+        time_calls(cached.process_user_message, [(m,) for m in messages])
+    )
+
+    start = time.perf_counter()
+    for _ in processor.process_messages(messages):
+        pass
+    batch_seconds = time.perf_counter() - start
+    # A streaming batch has no per-message latency, only amortized cost
+    results["process_messages_batch"] = {
+        "count": len(messages),
+        "mean_us": round(batch_seconds / len(messages) * 1e6, 3),
+        "ops_per_sec": round(len(messages) / batch_seconds, 1),
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000, help="messages per scenario")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[4, 16, 64], help="words per message")
+    parser.add_argument("--hit-ratios", type=float, nargs="+", default=[0.0, 0.5, 1.0])
+    parser.add_argument("--sentiment", default="textblob", help="sentiment backend name")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report to this path")
+    parser.add_argument("--compare", help="baseline JSON report to diff against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown before flagging")
+    args = parser.parse_args()
+
+    report = {
+        "metadata": run_metadata(
+            messages=args.messages, lengths=args.lengths, hit_ratios=args.hit_ratios,
+            sentiment=args.sentiment, seed=args.seed,
+        ),
+        "results": {},
+    }
+    corpus_source = MusicNLPProcessor(cache_size=0)
+    for length in args.lengths:
+        for hit_ratio in args.hit_ratios:
+            key = f"len={length},hit={hit_ratio:g}"
+            messages = make_chat_corpus(corpus_source, args.messages, length, hit_ratio, args.seed)
+            report["results"][key] = bench_scenario(messages, args.sentiment)
+            print_table(key, report["results"][key])
+
+    if args.json:
+        write_report(args.json, report)
+        print(f"\nwrote {args.json}")
+
+    if args.compare:
+        regressions = compare_reports(load_report(args.compare), report, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than baseline by more than {args.threshold:.0%}:")
+            for key, stage, before, after, ratio in regressions:
+                print(f"  {key} {stage}: {before:.1f} -> {after:.1f} us ({ratio:.2f}x)")
+            sys.exit(1)
+        print("\nno regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Side-by-side benchmark of the sentiment backends behind the NLP fallback.
+
+Reports per-message latency for each backend and how often the lexicon backend
+reaches the same happy/sad/relaxed fallback decision as TextBlob.
+
+    python benchmarks/bench_sentiment.py --messages 5000 --seed 7
+
+Sentiment words are drawn from TextBlob's own lexicon, not the smaller
+data/sentiment_lexicon.tsv, so words the lexicon backend does not know count
+against its agreement.
+"""
+import argparse
+import random
+import time
+
+from common import FILLER_WORDS, make_chat_corpus, print_table, summarize, time_calls
+from nlp_processor import MusicNLPProcessor
+from sentiment import LexiconSentiment, TextBlobSentiment
+
+MODIFIERS = ["not", "never", "very", "really", "so", "slightly", "don't"]
+
+
+def textblob_words():
+    """Single-word entries of TextBlob's sentiment lexicon, or None without textblob"""
+    try:
+        from textblob.en import sentiment
+    except ImportError:
+        return None
+    return sorted(word for word in sentiment if " " not in word)
+
+
+def make_corpus(count, seed, sentiment_words):
+    """Build chat-like messages that mix filler, sentiment words and modifiers"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        words = []
+        for _ in range(rng.randint(2, 14)):
+            roll = rng.random()
+            if roll < 0.25:
+                words.append(rng.choice(sentiment_words))
+            elif roll < 0.35:
+                words.append(rng.choice(MODIFIERS))
+            else:
+                words.append(rng.choice(FILLER_WORDS))
+        messages.append(" ".join(words))
+    return messages
+
+
+def time_backend(backend, messages):
+    """Return (polarities, latency summary) for one backend"""
+    backend.warm_up()
+    summary = summarize(time_calls(backend.polarity, [(message,) for message in messages]))
+    return [backend.polarity(message) for message in messages], summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    processor = MusicNLPProcessor(cache_size=0)
+    words = textblob_words()
+    if words is None:
+        print("textblob is not installed; timing the lexicon backend on keyword-free chat messages only")
+        messages = make_chat_corpus(processor, args.messages, 8, 0.0, seed=args.seed)
+    else:
+        messages = make_corpus(args.messages, args.seed, words)
+
+    load_start = time.perf_counter()
+    LexiconSentiment().warm_up()
+    print(f"lexicon load: {(time.perf_counter() - load_start) * 1000:.1f} ms")
+
+    rows = {}
+    lexicon_scores, rows["lexicon"] = time_backend(LexiconSentiment(), messages)
+    if words is not None:
+        textblob_scores, rows["textblob"] = time_backend(TextBlobSentiment(), messages)
+    print_table(f"sentiment polarity, {len(messages)} messages", rows)
+    if words is None:
+        return
+
+    decide = processor._emotions_from_polarity
+    agree = sum(decide(a) == decide(b) for a, b in zip(lexicon_scores, textblob_scores))
+    print(f"\nfallback agreement: {agree}/{len(messages)} ({agree / len(messages):.1%})")
+    print(f"mean speedup: {rows['textblob']['mean_us'] / rows['lexicon']['mean_us']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
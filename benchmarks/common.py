@@ -0,0 +1,136 @@
+"""Shared helpers for the benchmark scripts: synthetic corpora and timing summaries."""
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# Words that never hit the emotion/activity vocabulary
+FILLER_WORDS = (
+    "i am the a some this that me my for with and of to it just maybe "
+    "today tonight songs music play something kind feel need want give "
+    "while after before lately week weekend morning evening"
+).split()
+
+
+def make_chat_corpus(processor, count, length, hit_ratio, seed=0):
+    """Generate chat messages of roughly `length` words.
+
+    A `hit_ratio` share of messages contains one emotion or activity keyword
+    (multi-word phrases included); the rest only contain filler words.
+    """
+    rng = random.Random(seed)
+    keywords = sorted(
+        {keyword for keywords in processor.emotion_keywords.values() for keyword in keywords}
+        | set(processor.activity_mapping)
+    )
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(FILLER_WORDS) for _ in range(max(length, 1))]
+        if rng.random() < hit_ratio:
+            words[rng.randrange(len(words))] = rng.choice(keywords)
+        messages.append(" ".join(words))
+    return messages
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    rank = max(int(math.ceil(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(samples_us, wall_seconds=None):
+    """Latency summary (microseconds) plus throughput for a list of samples"""
+    ordered = sorted(samples_us)
+    total = wall_seconds if wall_seconds is not None else sum(samples_us) / 1e6
+    return {
+        "count": len(ordered),
+        "mean_us": round(statistics.mean(ordered), 3) if ordered else 0.0,
+        "p50_us": round(percentile(ordered, 50), 3),
+        "p90_us": round(percentile(ordered, 90), 3),
+        "p99_us": round(percentile(ordered, 99), 3),
+        "max_us": round(ordered[-1], 3) if ordered else 0.0,
+        "ops_per_sec": round(len(ordered) / total, 1) if total else 0.0,
+    }
+
+
+def time_calls(func, args_list):
+    """Call func(*args) for each args tuple and return per-call latencies in microseconds"""
+    samples = []
+    clock = time.perf_counter
+    for args in args_list:
+        start = clock()
+        func(*args)
+        samples.append((clock() - start) * 1e6)
+    return samples
+
+
+def run_metadata(**params):
+    """Describe the environment and parameters a report was produced with"""
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "git_revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "params": params,
+    }
+
+
+def print_table(title, rows):
+    """Print {name: summary} rows as an aligned table"""
+    print(f"\n{title}")
+    print(f"{'stage':<28}{'mean us':>10}{'p50 us':>10}{'p90 us':>10}{'p99 us':>10}{'ops/s':>12}")
+    for name, summary in rows.items():
+        cells = "".join(
+            f"{summary[key]:>10.1f}" if key in summary else f"{'-':>10}"
+            for key in ("mean_us", "p50_us", "p90_us", "p99_us")
+        )
+        print(f"{name:<28}{cells}{summary['ops_per_sec']:>12.0f}")
+
+
+def compare_reports(baseline, current, threshold):
+    """Return (key, stage, baseline, current, ratio) for stages slower than threshold.
+
+    Stages are compared on p50 latency, or mean latency when no p50 was recorded.
+    """
+    regressions = []
+    for key, stages in current.get("results", {}).items():
+        for stage, summary in stages.items():
+            before = baseline.get("results", {}).get(key, {}).get(stage)
+            metric = "p50_us" if "p50_us" in summary else "mean_us"
+            if not before or not before.get(metric):
+                continue
+            ratio = summary[metric] / before[metric]
+            if ratio > 1 + threshold:
+                regressions.append((key, stage, before[metric], summary[metric], ratio))
+    return regressions
+
+
+def load_report(path):
+    """Read a JSON report written by write_report"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_report(path, report):
+    """Write a report as stable, diffable JSON"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
@@ -0,0 +1,79 @@
+"""HTTP load generator for /chat (and optionally /chat/batch) against a running server.
+
+    python benchmarks/load_chat.py --url http://localhost:5000 --requests 2000 --concurrency 16
+
+Reports client-side latency percentiles, throughput and error counts, and can
+write the same JSON report format as bench_nlp.py.
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common import make_chat_corpus, print_table, run_metadata, summarize, write_report
+from nlp_processor import MusicNLPProcessor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--length", type=int, default=8, help="words per message")
+    parser.add_argument("--hit-ratio", type=float, default=0.7)
+    parser.add_argument("--unique", type=int, default=200, help="distinct messages in the corpus")
+    parser.add_argument("--batch-size", type=int, default=0, help="send /chat/batch requests of this size")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report to this path")
+    args = parser.parse_args()
+
+    corpus = make_chat_corpus(MusicNLPProcessor(cache_size=0), args.unique, args.length, args.hit_ratio, args.seed)
+    if args.batch_size:
+        endpoint = f"{args.url.rstrip('/')}/chat/batch"
+        payloads = [
+            {"messages": [corpus[(i + j) % len(corpus)] for j in range(args.batch_size)]}
+            for i in range(args.requests)
+        ]
+    else:
+        endpoint = f"{args.url.rstrip('/')}/chat"
+        payloads = [{"message": corpus[i % len(corpus)]} for i in range(args.requests)]
+
+    local = threading.local()
+    errors = []
+
+    def send(payload):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = session.post(endpoint, json=payload, timeout=args.timeout)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        except requests.RequestException as e:
+            errors.append(type(e).__name__)
+        return (time.perf_counter() - start) * 1e6
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        samples = list(pool.map(send, payloads))
+    wall = time.perf_counter() - start
+
+    name = "chat_batch" if args.batch_size else "chat"
+    results = {name: summarize(samples, wall_seconds=wall)}
+    results[name]["errors"] = len(errors)
+    print_table(f"{endpoint} x{args.requests} @ concurrency {args.concurrency}", results)
+    if errors:
+        print(f"{len(errors)} failed requests, e.g. {errors[:5]}")
+
+    if args.json:
+        report = {"metadata": run_metadata(**vars(args)), "results": {"load": results}}
+        write_report(args.json, report)
+        print(f"\nwrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,577 @@
+import base64
+import bisect
+import hashlib
+import heapq
+import random
+import threading
+import time
+from itertools import repeat
+
+
+# Genre columns of the legacy music_recommendations table, and the genre values in catalog_songs
+GENRE_COLUMNS = (
+    "sad_music",
+    "romantic_music",
+    "party_music",
+    "happy_music",
+    "melancholy_music",
+    "focus_music",
+    "instrumental_music",
+    "k_pop_music",
+    "electronic_music",
+    "rnb_music",
+    "blues_music",
+    "personal_fav",
+    "native_music",
+    "classical_music",
+    "workout_music",
+    "rock_music",
+    "rap_music",
+    "pop_music",
+    "jazz_music",
+    "motivational_music",
+    "trending_music",
+    "latest_music",
+    "top_music",
+    "hidden_gems_music",
+    "developers_choice_music",
+)
+
+
+def encode_cursor(genre, position):
+    """Opaque pagination cursor pointing just after `position` in `genre`"""
+    raw = f"{genre}:{position}".encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(genre, cursor):
+    """Return the position a cursor points after; ValueError if it is malformed or for another genre"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_genre, position = base64.urlsafe_b64decode(padded.encode()).decode().rsplit(":", 1)
+        position = int(position)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if cursor_genre != genre:
+        raise ValueError("Cursor belongs to a different genre")
+    return position
+
+
+class CatalogSnapshot:
+    """Per-worker copy of the catalog: for each genre, its songs in position order.
+
+    `token` is the DB change token it was loaded at; `version` hashes its
+    content, so it is the same in every worker that loaded the same rows.
+    """
+
+    def __init__(self, songs, positions, token, version, load_ms):
+        self.songs = songs  # {genre: (song, ...)}
+        self.positions = positions  # {genre: (position, ...)} parallel to songs
+        self.token = token
+        self.version = version
+        self.load_ms = load_ms
+        self.loaded_at = time.monotonic()
+        # Last time the change token was confirmed against the DB
+        self.checked_at = self.loaded_at
+
+    def count(self, genre):
+        return len(self.songs.get(genre, ()))
+
+
+class GenreCatalog:
+    """Read access to the long-format song catalog: one (genre, position, song) row per song.
+
+    `model` is the CatalogSong table, indexed on (genre, position), so a genre
+    lookup only touches that genre's rows.
+
+    With a positive ttl, reads are served from an in-memory CatalogSnapshot.
+    Once the snapshot is older than ttl, requests keep getting it while one
+    background thread revalidates it against a cheap change token (row count
+    and max id) and reloads only when that token moved; the token does not see
+    in-place UPDATEs, which need an invalidate(). If the DB is slow or down,
+    the stale snapshot keeps serving. A ttl of 0 sends every read to the DB.
+    """
+
+    # After a failed refresh, retry this many seconds later instead of a full ttl
+    RETRY_AFTER = 10
+
+    # Batches of random positions probed per genre before sampling gives up on probing
+    SAMPLE_PROBE_ROUNDS = 4
+
+    def __init__(self, db, model, genres, ttl=300, app=None, count_ttl=60):
+        self.db = db
+        self.model = model
+        self.genres = tuple(genres)
+        self.ttl = ttl
+        self.app = app
+        # Per-genre totals used when there is no snapshot: {genre: (count, expires_at)}
+        self.count_ttl = count_ttl
+        self._counts = {}
+        # Change token used for versioning when there is no snapshot: (token, expires_at)
+        self._token = None
+        # Per-genre position arrays used for sampling when there is no snapshot
+        self._positions = {}
+        self._snapshot = None
+        self._lock = threading.Lock()
+        # Held while a snapshot is being built, so only one load runs at a time
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self.refreshes = 0
+        self.revalidations = 0
+        self.failures = 0
+
+    def snapshot(self):
+        """Return the in-memory snapshot (possibly stale), or None when caching is off or unavailable"""
+        if not self.ttl:
+            return None
+
+        snapshot = self._snapshot
+        if snapshot is None:
+            # One request loads; the others read from the DB instead of loading too
+            if not self._load_lock.acquire(blocking=False):
+                return None
+            try:
+                return self._snapshot or self.refresh()
+            except Exception as e:
+                self.failures += 1
+                print(f"Catalog load failed, falling back to DB reads: {e}")
+                return None
+            finally:
+                self._load_lock.release()
+
+        if time.monotonic() - snapshot.checked_at > self.ttl:
+            self._refresh_in_background()
+        return snapshot
+
+    def invalidate(self):
+        """Drop cached counts and reload the snapshot from the DB now.
+
+        The current snapshot keeps serving until the new one is built and
+        swapped in, and also stays if the reload fails.
+        """
+        self._counts = {}
+        self._token = None
+        self._positions = {}
+        if self.ttl:
+            with self._load_lock:
+                return self.refresh(force=True)
+        return None
+
+    def refresh(self, force=False):
+        """Revalidate the snapshot against the change token, reloading it if the catalog changed"""
+        token = self._change_token()
+        current = self._snapshot
+        if current is not None and not force and token == current.token:
+            current.checked_at = time.monotonic()
+            self.revalidations += 1
+            return current
+
+        snapshot = self._load(token)
+        self._snapshot = snapshot
+        self.refreshes += 1
+        return snapshot
+
+    def _refresh_in_background(self):
+        """Start one refresh thread unless one is already running"""
+        with self._lock:
+            if self._refreshing or self.app is None:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="catalog-refresh", daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            with self.app.app_context(), self._load_lock:
+                self.refresh()
+        except Exception as e:
+            self.failures += 1
+            print(f"Catalog refresh failed, serving stale snapshot: {e}")
+            snapshot = self._snapshot
+            if snapshot is not None:
+                snapshot.checked_at = time.monotonic() - self.ttl + min(self.ttl, self.RETRY_AFTER)
+        finally:
+            self._refreshing = False
+
+    def _change_token(self):
+        """Cheap token that moves when rows are added or removed"""
+        model = self.model
+        db = self.db
+        count, max_id = db.session.execute(
+            db.select(db.func.count(model.id), db.func.max(model.id))
+        ).one()
+        return (count, max_id)
+
+    def _cached_change_token(self):
+        """Change token cached for count_ttl, like the per-genre counts"""
+        cached = self._token
+        now = time.monotonic()
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        token = self._change_token()
+        self._token = (token, now + self.count_ttl)
+        return token
+
+    def _load(self, token):
+        """Read the whole catalog once and build a new snapshot"""
+        start = time.perf_counter()
+        model = self.model
+        db = self.db
+        rows = db.session.execute(
+            db.select(model.genre, model.position, model.song).order_by(model.genre, model.position)
+        ).all()
+
+        songs = {genre: [] for genre in self.genres}
+        positions = {genre: [] for genre in self.genres}
+        digest = hashlib.sha1()
+        for genre, position, song in rows:
+            if genre in songs:
+                songs[genre].append(song)
+                positions[genre].append(position)
+                digest.update(f"{genre}\0{position}\0{song}\n".encode())
+        return CatalogSnapshot(
+            {genre: tuple(values) for genre, values in songs.items()},
+            {genre: tuple(values) for genre, values in positions.items()},
+            token,
+            digest.hexdigest()[:20],
+            (time.perf_counter() - start) * 1000,
+        )
+
+    def version_token(self):
+        """Return (version, strong) for the catalog reads are currently served from.
+
+        With a snapshot, version is its content hash: strong, since every
+        worker serving the same rows gives the same version. Without one, reads
+        go to the DB and version is the count/max change token, cached for
+        count_ttl; it misses in-place updates, so it is only good for weak
+        validation.
+        """
+        snapshot = self.snapshot()
+        if snapshot is not None:
+            return snapshot.version, True
+        return "{}-{}".format(*self._cached_change_token()), False
+
+    def stats(self):
+        """Snapshot age, size and refresh counters for this worker"""
+        snapshot = self._snapshot
+        info = {
+            "enabled": bool(self.ttl),
+            "ttl": self.ttl,
+            "refreshes": self.refreshes,
+            "revalidations": self.revalidations,
+            "failures": self.failures,
+            "refreshing": self._refreshing,
+            "loaded": snapshot is not None,
+        }
+        if snapshot is not None:
+            now = time.monotonic()
+            info.update({
+                "token": list(snapshot.token),
+                "version": snapshot.version,
+                "age_seconds": round(now - snapshot.loaded_at, 3),
+                "checked_seconds_ago": round(now - snapshot.checked_at, 3),
+                "load_ms": round(snapshot.load_ms, 3),
+                "songs": sum(len(songs) for songs in snapshot.songs.values()),
+            })
+        return info
+
+    def genre_count(self, genre):
+        """Number of songs in a genre, from the snapshot or a short-lived cached COUNT"""
+        snapshot = self.snapshot()
+        if snapshot is not None:
+            return snapshot.count(genre)
+
+        cached = self._counts.get(genre)
+        now = time.monotonic()
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        model = self.model
+        count = model.query.filter(model.genre == genre).count()
+        self._counts[genre] = (count, now + self.count_ttl)
+        return count
+
+    def genre_page(self, genre, offset, limit):
+        """Return (songs, total) for one page of a genre by offset"""
+        if offset < 0 or limit < 1:
+            raise ValueError("offset must be at least 0 and limit at least 1")
+        snapshot = self.snapshot()
+        if snapshot is not None:
+            songs = snapshot.songs.get(genre, ())
+            return list(songs[offset:offset + limit]), len(songs)
+
+        model = self.model
+        songs = (
+            model.query.with_entities(model.song)
+            .filter(model.genre == genre)
+            .order_by(model.position)
+            .offset(offset)
+            .limit(limit)
+            .all()
+        )
+        return [song[0] for song in songs], self.genre_count(genre)
+
+    def genre_page_after(self, genre, after_position, limit):
+        """Keyset page: up to `limit` songs with position > after_position.
+
+        Returns (songs, last position or None, has_more). Cost depends on the
+        page size, not on how deep into the genre the page is.
+        """
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        snapshot = self.snapshot()
+        if snapshot is not None:
+            positions = snapshot.positions.get(genre, ())
+            start = bisect.bisect_right(positions, after_position)
+            page_positions = positions[start:start + limit]
+            songs = list(snapshot.songs[genre][start:start + limit]) if page_positions else []
+            last = page_positions[-1] if page_positions else None
+            return songs, last, start + limit < len(positions)
+
+        model = self.model
+        rows = (
+            model.query.with_entities(model.position, model.song)
+            .filter(model.genre == genre, model.position > after_position)
+            .order_by(model.position)
+            .limit(limit + 1)
+            .all()
+        )
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return [row[1] for row in rows], (rows[-1][0] if rows else None), has_more
+
+    def top_songs_by_genre(self, genres, per_genre):
+        """Fetch up to per_genre songs for each genre in one DB round trip.
+
+        Returns {genre: [song, ...]} in the order the genres were given; unknown
+        genres are dropped and duplicates collapsed. Served from the snapshot
+        when one is available.
+        """
+        genres = [genre for genre in dict.fromkeys(genres) if genre in self.genres]
+        songs_by_genre = {genre: [] for genre in genres}
+        if not genres or per_genre <= 0:
+            return songs_by_genre
+
+        snapshot = self.snapshot()
+        if snapshot is not None:
+            for genre in genres:
+                songs_by_genre[genre] = list(snapshot.songs[genre][:per_genre])
+            return songs_by_genre
+
+        db = self.db
+        model = self.model
+        # One SELECT per genre, wrapped as subqueries so LIMIT is valid inside UNION ALL
+        parts = []
+        for genre in genres:
+            part = (
+                db.select(model.genre, model.position, model.song)
+                .where(model.genre == genre)
+                .order_by(model.position)
+                .limit(per_genre)
+                .subquery()
+            )
+            parts.append(db.select(part.c.genre, part.c.position, part.c.song))
+
+        rows = db.session.execute(db.union_all(*parts)).all()
+        for genre, _, song in sorted(rows, key=lambda row: (row[0], row[1])):
+            songs_by_genre[genre].append(song)
+        return songs_by_genre
+
+    def _genre_positions(self, genres):
+        """{genre: positions of every song in it}, cached per genre for count_ttl.
+
+        Genres missing from the cache are read together in one index-only query.
+        """
+        now = time.monotonic()
+        positions = {}
+        missing = []
+        for genre in genres:
+            cached = self._positions.get(genre)
+            if cached is not None and cached[1] > now:
+                positions[genre] = cached[0]
+            else:
+                missing.append(genre)
+        if missing:
+            model = self.model
+            db = self.db
+            loaded = {genre: [] for genre in missing}
+            for genre, position in db.session.execute(
+                db.select(model.genre, model.position)
+                .where(model.genre.in_(missing))
+                .order_by(model.genre, model.position)
+            ):
+                loaded[genre].append(position)
+            for genre, values in loaded.items():
+                positions[genre] = tuple(values)
+                self._positions[genre] = (positions[genre], now + self.count_ttl)
+        return positions
+
+    def _sample_by_position_range(self, genres, k, rng):
+        """Uniform sample of up to k songs per genre, probing random positions in each genre's range.
+
+        Reads every genre's min/max position in one grouped query, then probes
+        all genres together, one statement per round. Returns {genre: songs};
+        a genre maps to None when it is too small or too sparse for probing to
+        pay off, so the caller samples from its full position list instead.
+        """
+        model = self.model
+        db = self.db
+        ranges = {
+            genre: (low, high)
+            for genre, low, high in db.session.execute(
+                db.select(model.genre, db.func.min(model.position), db.func.max(model.position))
+                .where(model.genre.in_(genres))
+                .group_by(model.genre)
+            ).all()
+        }
+
+        sampled = {}
+        probing = {}
+        for genre in genres:
+            if genre not in ranges:
+                sampled[genre] = []
+                continue
+            low, high = ranges[genre]
+            if high - low + 1 <= 4 * k:
+                sampled[genre] = None
+                continue
+            # Hits are kept in draw order from distinct uniform draws: a uniform sample
+            probing[genre] = {"seen": set(), "picked": [], "hits": 0, "density": 0.5}
+
+        for _ in range(self.SAMPLE_PROBE_ROUNDS):
+            candidates = {}
+            for genre, state in list(probing.items()):
+                low, high = ranges[genre]
+                seen = state["seen"]
+                draws = int((k - len(state["picked"])) / state["density"] * 1.25) + 1
+                if len(seen) + draws > (high - low + 1) // 2:
+                    sampled[genre] = None
+                    del probing[genre]
+                    continue
+                drawn = []
+                while len(drawn) < draws:
+                    position = rng.randint(low, high)
+                    if position not in seen:
+                        seen.add(position)
+                        drawn.append(position)
+                candidates[genre] = drawn
+            if not candidates:
+                break
+
+            rows = db.session.execute(
+                db.select(model.genre, model.position, model.song).where(db.or_(*[
+                    db.and_(model.genre == genre, model.position.in_(positions))
+                    for genre, positions in candidates.items()
+                ]))
+            ).all()
+            found = {(genre, position): song for genre, position, song in rows}
+            for genre, positions in candidates.items():
+                state = probing[genre]
+                round_hits = [found[(genre, position)] for position in positions if (genre, position) in found]
+                state["hits"] += len(round_hits)
+                state["picked"].extend(round_hits[:k - len(state["picked"])])
+                if len(state["picked"]) >= k:
+                    sampled[genre] = state["picked"]
+                    del probing[genre]
+                else:
+                    state["density"] = max(state["hits"] / len(state["seen"]), 0.01)
+
+        for genre in probing:
+            sampled[genre] = None
+        return sampled
+
+    def sample_songs_by_genre(self, genres, per_genre, seed=None):
+        """Uniform random sample of up to per_genre songs from each genre.
+
+        Samples indexes into the per-genre position array, so the cost is
+        O(per_genre) per genre on the snapshot. Without a snapshot, random
+        positions are probed inside each genre's position range, which reads
+        O(per_genre) rows per genre in a fixed number of statements. Only
+        genres that are small or sparse in that range fall back to reading
+        their whole (cached) position list. The same seed
+        gives the same sample for the same catalog and serving path.
+        """
+        rng = random.Random(seed)
+        genres = [genre for genre in dict.fromkeys(genres) if genre in self.genres]
+        songs_by_genre = {genre: [] for genre in genres}
+        if not genres or per_genre <= 0:
+            return songs_by_genre
+
+        snapshot = self.snapshot()
+        if snapshot is not None:
+            for genre in genres:
+                songs = snapshot.songs[genre]
+                picks = rng.sample(range(len(songs)), min(per_genre, len(songs)))
+                songs_by_genre[genre] = [songs[i] for i in picks]
+            return songs_by_genre
+
+        wanted = {}
+        sampled = self._sample_by_position_range(genres, per_genre, rng)
+        fallback = self._genre_positions([genre for genre in genres if sampled[genre] is None])
+        for genre in genres:
+            if sampled[genre] is not None:
+                songs_by_genre[genre] = sampled[genre]
+                continue
+            positions = fallback[genre]
+            picks = rng.sample(range(len(positions)), min(per_genre, len(positions)))
+            if picks:
+                wanted[genre] = [positions[i] for i in picks]
+        if not wanted:
+            return songs_by_genre
+
+        model = self.model
+        db = self.db
+        rows = db.session.execute(
+            db.select(model.genre, model.position, model.song).where(db.or_(*[
+                db.and_(model.genre == genre, model.position.in_(positions))
+                for genre, positions in wanted.items()
+            ]))
+        ).all()
+        found = {(genre, position): song for genre, position, song in rows}
+        for genre, positions in wanted.items():
+            songs_by_genre[genre] = [
+                found[(genre, position)] for position in positions if (genre, position) in found
+            ]
+        return songs_by_genre
+
+    def iter_wide_rows(self, batch_size=1000, include_nulls=False):
+        """Stream the legacy one-row-per-position shape used by GET /songs.
+
+        Yields {"id": position, <genre>: song, ...} ordered by position. Genres
+        with no song are omitted unless include_nulls is set.
+        The snapshot is picked when this is called, so the rows match the
+        version_token() taken at the same time. Without a snapshot, rows are
+        fetched with a server-side cursor in batches of batch_size, so memory
+        stays flat regardless of catalog size.
+        """
+        snapshot = self.snapshot()
+        if snapshot is not None:
+            rows = heapq.merge(*[
+                zip(snapshot.positions[genre], repeat(genre), snapshot.songs[genre])
+                for genre in sorted(self.genres)
+            ])
+        else:
+            rows = self._stream_rows(batch_size)
+        return self._wide_rows(rows, include_nulls)
+
+    def _stream_rows(self, batch_size):
+        model = self.model
+        db = self.db
+        statement = (
+            db.select(model.position, model.genre, model.song)
+            .order_by(model.position, model.genre)
+            .execution_options(yield_per=batch_size, stream_results=True)
+        )
+        yield from db.session.execute(statement)
+
+    def _wide_rows(self, rows, include_nulls):
+        """Fold (position, genre, song) rows in position order into one dict per position"""
+        current = None
+        for position, genre, song in rows:
+            if current is None or current["id"] != position:
+                if current is not None:
+                    yield current
+                current = {"id": position}
+                if include_nulls:
+                    current.update(dict.fromkeys(self.genres))
+            current[genre] = song
+        if current is not None:
+            yield current
@@ -0,0 +1,215 @@
+import gzip
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import g, request
+
+# brotli is optional: without it responses are only ever gzip-compressed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Only text-like bodies are worth compressing; images/audio are already compressed
+COMPRESSIBLE_MIMETYPES = frozenset(
+    ["application/json", "application/x-ndjson", "text/plain", "text/html", "text/css", "application/javascript"]
+)
+
+
+def add_vary(response, value):
+    """Add value to Vary, merging every Vary header into one.
+
+    response.vary only parses the first Vary line, so updating it would drop
+    the separate "Vary: Origin" line flask-cors adds.
+    """
+    values = []
+    for line in response.headers.getlist("Vary"):
+        for item in line.split(","):
+            item = item.strip()
+            if item and item.lower() not in (v.lower() for v in values):
+                values.append(item)
+    if value.lower() not in (v.lower() for v in values):
+        values.append(value)
+    response.headers["Vary"] = ", ".join(values)
+
+
+class CompressedCache:
+    """LRU of compressed response bodies, bounded by total bytes.
+
+    Keyed by (etag, encoding): the ETag already changes with the catalog
+    version, so stale entries simply stop being hit and age out.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self._entries[key] = (body, mimetype)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class ResponseCompressor:
+    """gzip/brotli compression of responses, negotiated from Accept-Encoding.
+
+    Registers an after_request hook on the app. Buffered bodies smaller than
+    min_size are left alone; streamed bodies are compressed chunk by chunk.
+    A view that sets g.compressed_cache_key (its ETag) gets the compressed
+    bytes kept in the cache, so cached_response() can replay them later.
+    """
+
+    def __init__(self, app=None, min_size=1024, gzip_level=6, brotli_quality=4, cache_bytes=32 * 1024 * 1024):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache = CompressedCache(cache_bytes)
+        self.encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+        self.app = app
+        if app is not None:
+            app.after_request(self.after_request)
+
+    def negotiate(self):
+        """Best encoding the client accepts, preferring brotli on a tie, or None"""
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            quality = request.accept_encodings.quality(encoding)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress(self, data, encoding):
+        if encoding == "br":
+            return brotli.compress(data, quality=self.brotli_quality)
+        # mtime=0 keeps the bytes deterministic, so a strong ETag still holds
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def _compressor(self, encoding):
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            return compressor.process, compressor.finish
+        # wbits=31 writes a gzip header (with mtime 0) instead of a zlib one
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+        return compressor.compress, compressor.flush
+
+    @staticmethod
+    def variant_etag(etag, encoding):
+        """ETag of the encoded representation; strong ETags must differ per encoding"""
+        return f"{etag}-{encoding}" if encoding else etag
+
+    def cached_response(self, etag, encoding):
+        """Response replaying cached compressed bytes for etag, or None"""
+        if encoding is None:
+            return None
+        entry = self.cache.get((etag, encoding))
+        if entry is None:
+            return None
+        body, mimetype = entry
+        response = self.app.response_class(body, mimetype=mimetype)
+        response.headers["Content-Encoding"] = encoding
+        response.set_etag(self.variant_etag(etag, encoding))
+        return response
+
+    def after_request(self, response):
+        if response.status_code == 304:
+            # Caches need the same Vary on a 304 as on the 200 it revalidates
+            add_vary(response, "Accept-Encoding")
+            return response
+        if (
+            response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+        ):
+            return response
+        add_vary(response, "Accept-Encoding")
+        if "Content-Encoding" in response.headers:
+            return response
+
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+        cache_key = g.get("compressed_cache_key")
+
+        if response.is_streamed:
+            response.response = self._compress_stream(response.response, encoding, cache_key, response.mimetype)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            data = self.compress(data, encoding)
+            response.set_data(data)
+            if cache_key is not None:
+                self.cache.put((cache_key, encoding), data, response.mimetype)
+
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(self.variant_etag(etag, encoding), weak)
+        return response
+
+    def _compress_stream(self, chunks, encoding, cache_key, mimetype):
+        """Compress a streamed body as it goes, caching the result if it completes"""
+        process, finish = self._compressor(encoding)
+        kept = [] if cache_key is not None else None
+        kept_size = 0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                out = process(chunk)
+                if out:
+                    if kept is not None:
+                        kept.append(out)
+                        kept_size += len(out)
+                        # Too big to ever fit in the cache: stop holding on to it
+                        if kept_size > self.cache.max_bytes:
+                            kept = None
+                    yield out
+            out = finish()
+            if kept is not None:
+                kept.append(out)
+                self.cache.put((cache_key, encoding), b"".join(kept), mimetype)
+            yield out
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
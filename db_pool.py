@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+def engine_options_from_env(uri):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database, sized from DB_POOL_* env vars.
+
+    SQLite keeps Flask-SQLAlchemy's own pool defaults, since it does not use a
+    queue pool.
+    """
+    if not uri or uri.startswith("sqlite"):
+        return {}
+    return {
+        "poolclass": InstrumentedQueuePool,
+        # Connections kept open per worker, and extra ones allowed under bursts
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 5)),
+        # Seconds a request waits for a free connection before failing
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 10)),
+        # Close connections older than this, below Postgres/proxy idle timeouts
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        # Test each connection on checkout so Postgres restarts don't surface as errors
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+    }
+
+
+class PoolMetrics:
+    """Per-worker counters for one connection pool"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.overflow_connects = 0
+        self.invalidations = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.slow_waits = 0
+        self.checked_out_peak = 0
+        self.overflow_peak = 0
+        self._lock = threading.Lock()
+
+    def record_checkout(self, waited, checked_out):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if waited >= 0.1:
+                self.slow_waits += 1
+            self.checked_out_peak = max(self.checked_out_peak, checked_out)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self, overflow):
+        with self._lock:
+            self.connects += 1
+            if overflow > 0:
+                self.overflow_connects += 1
+                self.overflow_peak = max(self.overflow_peak, overflow)
+
+    def record_checkin(self):
+        with self._lock:
+            self.checkins += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "overflow_connects": self.overflow_connects,
+                "overflow_peak": self.overflow_peak,
+                "invalidations": self.invalidations,
+                "checked_out_peak": self.checked_out_peak,
+                "wait_ms_avg": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self.wait_max * 1000, 3),
+                "slow_waits": self.slow_waits,
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records checkout wait times, timeouts and overflow use.
+
+    The wait covers everything between asking for a connection and getting
+    one: queueing for a free slot, opening a new connection and the pre-ping.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fresh = kwargs.get("_dispatch") is None
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+        if fresh:
+            # recreate() hands its listeners to the new pool, so register only once
+            metrics = self.metrics
+            event.listen(self, "invalidate", lambda *args: metrics.record_invalidation())
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_checkout(time.perf_counter() - start, self.checkedout())
+        return connection
+
+    def _create_connection(self):
+        connection = super()._create_connection()
+        self.metrics.record_connect(self._overflow)
+        return connection
+
+    def _do_return_conn(self, record):
+        self.metrics.record_checkin()
+        super()._do_return_conn(record)
+
+
+def pool_stats(engine):
+    """Configuration, current state and (if instrumented) counters of engine's pool"""
+    pool = engine.pool
+    stats = {"pid": os.getpid(), "pool_class": type(pool).__name__, "status": pool.status()}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            max_overflow=pool._max_overflow,
+            timeout=pool.timeout(),
+            recycle=pool._recycle,
+            pre_ping=pool._pre_ping,
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        stats["metrics"] = metrics.stats()
+    return stats
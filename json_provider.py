@@ -0,0 +1,70 @@
+from flask.json.provider import DefaultJSONProvider, _default
+
+from metrics import metrics
+
+# orjson is optional: without it the provider falls back to Flask's stdlib encoder
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson when it is installed.
+
+    Keys keep insertion order instead of being sorted, and the output is
+    compact, which is what API clients get from every jsonify() call.
+    """
+
+    sort_keys = False
+    compact = True
+
+    def dumps_bytes(self, obj):
+        """Encode obj straight to UTF-8 bytes"""
+        if orjson is not None:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        return super().dumps(obj).encode()
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return self.dumps_bytes(obj).decode()
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with metrics.stage("serialize"):
+            body = self.dumps_bytes(obj) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def stream_json_array(rows, dumps_bytes, rows_per_chunk=200):
+    """Encode rows as one JSON array, yielding a chunk of rows at a time"""
+    yield b"["
+    chunk = []
+    first = True
+    for row in rows:
+        chunk.append(dumps_bytes(row))
+        if len(chunk) >= rows_per_chunk:
+            yield (b"" if first else b",") + b",".join(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        yield (b"" if first else b",") + b",".join(chunk)
+    yield b"]"
+
+
+def stream_ndjson(rows, dumps_bytes, rows_per_chunk=200):
+    """Encode rows as newline-delimited JSON, yielding a chunk of rows at a time"""
+    chunk = []
+    for row in rows:
+        chunk.append(dumps_bytes(row))
+        if len(chunk) >= rows_per_chunk:
+            yield b"\n".join(chunk) + b"\n"
+            chunk = []
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
@@ -0,0 +1,106 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def user_cache_key(secret):
+    """Stable, non-reversible cache namespace for a user, derived from one of their tokens"""
+    return hashlib.sha256(secret.encode()).hexdigest()[:32]
+
+
+class LibraryEntry:
+    __slots__ = ("body", "etag", "size", "fetched_at", "stale")
+
+    def __init__(self, body, etag, size, fetched_at):
+        self.body = body
+        self.etag = etag
+        self.size = size
+        self.fetched_at = fetched_at
+        self.stale = False
+
+
+class LibraryCache:
+    """Per-user cache of Spotify library responses, keyed on (user, request URL).
+
+    Entries hold the raw response bytes and are fresh for ttl seconds. After
+    that (or once invalidated) they are kept for revalidation with their
+    upstream ETag until evicted; the cache is LRU-bounded by the total size
+    of those bytes.
+    """
+
+    def __init__(self, ttl=60, max_bytes=16 * 1024 * 1024, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, user, url):
+        """Return (entry, fresh) for user's url; entry is None when nothing is cached"""
+        with self._lock:
+            entry = self._entries.get((user, url))
+            if entry is None:
+                self.misses += 1
+                return None, False
+            self._entries.move_to_end((user, url))
+            fresh = not entry.stale and self._clock() - entry.fetched_at < self.ttl
+            if fresh:
+                self.hits += 1
+            return entry, fresh
+
+    def put(self, user, url, body, etag, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove((user, url))
+            self._entries[(user, url)] = LibraryEntry(body, etag, size, self._clock())
+            self._by_user.setdefault(user, set()).add(url)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def revalidated_entry(self, user, url):
+        """Upstream answered 304: the cached entry is fresh again"""
+        with self._lock:
+            entry = self._entries.get((user, url))
+            if entry is not None:
+                entry.fetched_at = self._clock()
+                entry.stale = False
+                self.revalidated += 1
+
+    def invalidate(self, user):
+        """Force user's entries to revalidate; their ETags are kept so unchanged data still costs a 304"""
+        with self._lock:
+            for url in self._by_user.get(user, ()):
+                self._entries[(user, url)].stale = True
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry.size
+        user, url = key
+        urls = self._by_user.get(user)
+        if urls is not None:
+            urls.discard(url)
+            if not urls:
+                del self._by_user[user]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "users": len(self._by_user),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+            }
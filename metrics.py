@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus-style
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, cumulative count) pairs ending with +Inf"""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+def _labels(**labels):
+    parts = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return ",".join(parts)
+
+
+def _bound(value):
+    return "+Inf" if value == float("inf") else repr(value)
+
+
+class Metrics:
+    """Per-worker request counters and latency histograms, with named stage timers.
+
+    Stages (NLP steps, DB queries, Spotify calls, serialization) feed one
+    histogram each; inside a request they are also summed per request for the
+    optional Server-Timing header.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.requests = {}
+        self.request_latency = {}
+        self.stage_latency = {}
+        self.started_at = time.time()
+        self.server_timing = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app, server_timing=False):
+        """Time every request and optionally report its stages in a Server-Timing header"""
+        self.server_timing = server_timing
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def instrument_engine(self, engine):
+        """Time every SQL statement run on engine as the "db" stage"""
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def observe_stage(self, name, seconds):
+        with self._lock:
+            histogram = self.stage_latency.get(name)
+            if histogram is None:
+                histogram = self.stage_latency[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+        if has_request_context():
+            timings = g.setdefault("stage_timings", {})
+            timings[name] = timings.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as stage name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(name, time.perf_counter() - start)
+
+    def _before_request(self):
+        g.request_started = time.perf_counter()
+
+    def _after_request(self, response):
+        started = g.get("request_started")
+        if started is None:
+            return response
+        # Streamed bodies are still being produced here, so this is time to first byte for them
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        with self._lock:
+            key = (request.method, route, response.status_code)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.request_latency.get((request.method, route))
+            if histogram is None:
+                histogram = self.request_latency[(request.method, route)] = Histogram(self.buckets)
+            histogram.observe(elapsed)
+
+        if self.server_timing:
+            entries = [
+                f"{name};dur={seconds * 1000:.2f}" for name, seconds in g.get("stage_timings", {}).items()
+            ]
+            entries.append(f"total;dur={elapsed * 1000:.2f}")
+            response.headers["Server-Timing"] = ", ".join(entries)
+        return response
+
+    # The start time lives on the statement's execution context, which is discarded
+    # with it, so a statement that raises leaves nothing behind on the connection
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is not None:
+            self.observe_stage("db", time.perf_counter() - started)
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        pid = os.getpid()
+        lines = [
+            "# HELP process_start_time_seconds Start time of this worker since the epoch.",
+            "# TYPE process_start_time_seconds gauge",
+            f"process_start_time_seconds{{{_labels(pid=pid)}}} {self.started_at}",
+            "# HELP http_requests_total Requests handled, by route and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        with self._lock:
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{{{_labels(method=method, route=route, status=status, pid=pid)}}} {count}")
+
+            lines.append("# HELP http_request_duration_seconds Request latency up to the response headers.")
+            lines.append("# TYPE http_request_duration_seconds histogram")
+            for (method, route), histogram in sorted(self.request_latency.items()):
+                labels = _labels(method=method, route=route, pid=pid)
+                self._render_histogram(lines, "http_request_duration_seconds", labels, histogram)
+
+            lines.append("# HELP stage_duration_seconds Time spent in instrumented stages (NLP, DB, Spotify, serialization).")
+            lines.append("# TYPE stage_duration_seconds histogram")
+            for name, histogram in sorted(self.stage_latency.items()):
+                self._render_histogram(lines, "stage_duration_seconds", _labels(stage=name, pid=pid), histogram)
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histogram(lines, metric, labels, histogram):
+        for bound, count in histogram.cumulative():
+            lines.append(f'{metric}_bucket{{{labels},le="{_bound(bound)}"}} {count}')
+        lines.append(f"{metric}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+
+
+# Shared by the app, the spotify blueprint and the JSON provider
+metrics = Metrics()
@@ -0,0 +1,76 @@
+"""Create catalog_songs and backfill it from the wide music_recommendations table.
+
+    python migrate_catalog.py            # create the table if needed and backfill it
+    python migrate_catalog.py --check    # only compare row counts
+
+Each non-null genre cell in music_recommendations becomes one
+(genre, position, song) row, with position = the source row id. The backfill
+runs in one transaction and replaces any rows already in catalog_songs, so the
+script is safe to rerun after the wide table changes.
+
+Running app workers are not touched. The reinserted rows get new ids from the
+id sequence, which moves the catalog change token (row count, max id), so each
+worker reloads its snapshot at its next revalidation, within CATALOG_CACHE_TTL.
+To apply a backfill right away, POST /admin/catalog/invalidate to each worker.
+"""
+import argparse
+
+from app import CatalogSong, Music, app, db
+from catalog import GENRE_COLUMNS
+
+
+def source_count():
+    """Number of non-null genre cells in music_recommendations"""
+    total = 0
+    for genre in GENRE_COLUMNS:
+        column = getattr(Music, genre)
+        total += db.session.execute(
+            db.select(db.func.count()).select_from(Music).where(column.isnot(None))
+        ).scalar()
+    return total
+
+
+def target_count():
+    return db.session.execute(db.select(db.func.count(CatalogSong.id))).scalar()
+
+
+def backfill():
+    """Replace catalog_songs with one row per non-null genre cell, in a single statement"""
+    parts = [
+        db.select(
+            db.literal(genre).label("genre"),
+            Music.id.label("position"),
+            getattr(Music, genre).label("song"),
+        ).where(getattr(Music, genre).isnot(None))
+        for genre in GENRE_COLUMNS
+    ]
+    source = db.union_all(*parts)
+    db.session.execute(db.delete(CatalogSong))
+    db.session.execute(
+        db.insert(CatalogSong).from_select(["genre", "position", "song"], source)
+    )
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--check", action="store_true", help="only compare row counts")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if not args.check:
+            CatalogSong.__table__.create(db.engine, checkfirst=True)
+            # Indexes added after the table was first created
+            for index in CatalogSong.__table__.indexes:
+                index.create(db.engine, checkfirst=True)
+            backfill()
+
+        expected, actual = source_count(), target_count()
+        status = "OK" if expected == actual else "MISMATCH"
+        print(f"{status}: {expected} genre cells in music_recommendations, {actual} rows in catalog_songs")
+        if expected != actual:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
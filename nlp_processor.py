@@ -1,183 +1,630 @@
 import re
 import json
-from textblob import TextBlob
-from collections import Counter
+import itertools
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import nullcontext
+from types import MappingProxyType
 import random
 
-class MusicNLPProcessor:
-    def __init__(self):
-        # Emotion mapping to your database genres
-        self.emotion_genre_mapping = {
-            'sad': ['sad_music', 'blues_music', 'melancholy_music'],
-            'happy': ['happy_music', 'pop_music', 'party_music'],
-            'romantic': ['romantic_music', 'rnb_music', 'jazz_music'],
-            'energetic': ['workout_music', 'electronic_music', 'rock_music'],
-            'relaxed': ['focus_music', 'instrumental_music', 'classical_music'],
-            'nostalgic': ['blues_music', 'jazz_music', 'classical_music'],
-            'motivated': ['motivational_music', 'workout_music', 'rap_music'],
-            'party': ['party_music', 'electronic_music', 'pop_music'],
-            'melancholy': ['melancholy_music', 'sad_music', 'blues_music'],
-            'focus': ['focus_music', 'instrumental_music', 'classical_music']
-        }
-        
-        
-        # Fixed: Removed duplicate 'romantic' key and improved keyword patterns
-        self.emotion_keywords = {
-            'sad': ['sad', 'depressed', 'down', 'blue', 'crying', 'heartbroken', 'lonely', 'upset', 'hurt','low', 'awful', 'terrible', 'bad', 'miserable', 'gloomy', 'devastated', 'broken',
-        'disappointed', 'hopeless', 'grief', 'sorrow', 'despair', 'melancholic' ],
-    
-        'happy': ['happy', 'joyful', 'excited', 'cheerful', 'glad', 'upbeat', 'positive', 'elated','thrilled', 'ecstatic', 'fantastic', 'wonderful', 'amazing', 'great', 'awesome',
-        'excellent', 'delighted', 'overjoyed', 'euphoric', 'blissful'],
-    
-        'energetic': ['energetic', 'pumped', 'hyped', 'active', 'workout', 'gym', 'running', 'dance','exercise', 'fitness', 'cardio', 'training', 'intense', 'powerful', 'strong',
-        'adrenaline', 'boost', 'motivation', 'energy', 'pump', 'beast mode', 'sweat',
-        'lift', 'weights', 'crossfit', 'hiit', 'run', 'jog', 'sprint'],
-    
-        'romantic': ['love', 'romantic', 'date', 'crush', 'valentine', 'intimate','romance', 'affection', 'passion', 'relationship', 'boyfriend', 'girlfriend',
-        'husband', 'wife', 'partner', 'soulmate', 'sweetheart', 'darling', 'beloved',
-        'dinner', 'anniversary', 'proposal', 'wedding', 'honeymoon'],
-    
-        'relaxed': ['chill', 'relax', 'calm', 'peaceful', 'studying', 'meditation', 'zen', 'quiet','tranquil', 'serene', 'mellow', 'soothing', 'unwind', 'decompress', 'breathe',
-        'mindful', 'spa', 'massage', 'ambient', 'soft', 'gentle', 'laid back'],
-    
-        'party': ['party', 'club', 'dancing', 'celebration', 'fun', 'wild', 'night out','dance', 'nightclub', 'disco', 'rave', 'festival', 'concert', 'dj',
-        'bass', 'beat', 'groove', 'vibe', 'turn up', 'lit', 'banging', 'banger'],
+from sentiment import TextBlobSentiment
+
+# Tokens are runs of word characters, so token edges line up with regex \b boundaries
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def freeze_result(result):
+    """Return a read-only view of an analysis result with tuple-valued lists"""
+    return MappingProxyType({
+        'emotions': tuple(result['emotions']),
+        'activities': tuple(result['activities']),
+        'recommended_genres': tuple(result['recommended_genres']),
+        'confidence': result['confidence'],
+    })
+
+
+# Genres recommended when nothing in the message maps to a genre
+DEFAULT_GENRES = ('trending_music', 'top_music', 'developers_choice_music')
+
+FALLBACK_RESULT = freeze_result({
+    'emotions': [],
+    'activities': [],
+    'recommended_genres': DEFAULT_GENRES,
+    'confidence': 0.1
+})
+
+# Memoized (emotion set, activity set) signatures kept beyond the precomputed ones
+GENRE_TABLE_MAX = 4096
+
+# Versioned vocabulary file compiled into the keyword matcher and genre table
+VOCABULARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'music_vocabulary.json')
+VOCABULARY_SECTIONS = ('emotion_genre_mapping', 'emotion_keywords', 'activity_mapping')
+
+
+class ResultCache:
+    """Thread-safe LRU cache with an optional TTL and hit/miss/eviction counters"""
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store value under key, evicting the least recently used entry when full"""
+        if self.maxsize <= 0:
+            return
+        expires_at = self._clock() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry; counters are kept"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+def untimed_stage(name):
+    """Default stage timer: times nothing"""
+    return nullcontext()
+
+
+def preprocess_text(text):
+    """Clean and normalize input text"""
+    if not isinstance(text, str):
+        return ""
     
-        'focus': ['study', 'work', 'concentrate', 'focus', 'productivity', 'background','studying', 'working', 'office', 'homework', 'exam', 'concentration',
-        'reading', 'writing', 'coding', 'programming', 'task', 'project', 'deep work', 'workout']
-        }
-        
-        # Activity context mapping
-        self.activity_mapping = {
-            'workout': ['workout_music', 'electronic_music', 'motivational_music'],
-            'study': ['focus_music', 'instrumental_music', 'classical_music'],
-            'studying': ['focus_music', 'instrumental_music', 'classical_music'],  # Added variant
-            'party': ['party_music', 'electronic_music', 'pop_music'],
-            'driving': ['rock_music', 'pop_music', 'rap_music'],
-            'cooking': ['jazz_music', 'rnb_music', 'pop_music'],
-            'cleaning': ['pop_music', 'electronic_music', 'motivational_music'],
-            'sleeping': ['instrumental_music', 'classical_music', 'focus_music'],
-            'working': ['focus_music', 'instrumental_music', 'classical_music'],  # Added variant
-            'exercise': ['workout_music', 'electronic_music', 'motivational_music'],  # Added variant
-            'running': ['workout_music', 'electronic_music', 'motivational_music'],  # Added variant
-            'gym': ['workout_music', 'electronic_music', 'motivational_music'],  # Added variant
+    text = text.lower().strip()
+    # Remove special characters but keep spaces and handle contractions better
+    text = re.sub(r"[^\w\s']", ' ', text)
+    text = re.sub(r'\s+', ' ', text)  # Replace multiple spaces with single space
+    return text.strip()
+
+
+def file_signature(path):
+    """Cheap change token for a data file: (mtime_ns, size)"""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def load_vocabulary_file(path):
+    """Read and validate a vocabulary file, returning (data, file signature)"""
+    signature = file_signature(path)
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+
+    if not isinstance(data, dict) or 'version' not in data:
+        raise ValueError(f"{path}: vocabulary must be an object with a 'version'")
+    for section in VOCABULARY_SECTIONS:
+        mapping = data.get(section)
+        if not isinstance(mapping, dict):
+            raise ValueError(f"{path}: '{section}' must be an object")
+        for key, values in mapping.items():
+            if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+                raise ValueError(f"{path}: '{section}.{key}' must be a list of strings")
+    return data, signature
+
+
+class CompiledVocabulary:
+    """Read-only snapshot of the vocabulary plus the matcher and genre table built from it.
+
+    MusicNLPProcessor swaps whole snapshots by reference, so a request that picked
+    one up keeps a consistent view even while a reload is in progress.
+    """
+
+    _generations = itertools.count(1)
+
+    def __init__(self, data, source=None, signature=None):
+        start = time.perf_counter()
+        self.version = data.get('version')
+        self.source = source
+        self.signature = signature
+        self.generation = next(self._generations)
+        self.emotion_genre_mapping = self._freeze_mapping(data['emotion_genre_mapping'])
+        self.emotion_keywords = self._freeze_mapping(data['emotion_keywords'])
+        self.activity_mapping = self._freeze_mapping(data['activity_mapping'])
+
+        self._build_keyword_index()
+        self._build_genre_table()
+        self.compile_ms = (time.perf_counter() - start) * 1000
+
+    @staticmethod
+    def _freeze_mapping(mapping):
+        return MappingProxyType({key: tuple(values) for key, values in mapping.items()})
+
+    def to_data(self):
+        """Return the vocabulary as plain JSON-compatible data"""
+        data = {'version': self.version}
+        for section in VOCABULARY_SECTIONS:
+            data[section] = {key: list(values) for key, values in getattr(self, section).items()}
+        return data
+
+    def _build_keyword_index(self):
+        """Compile emotion keywords and activities into a token trie for single-pass matching"""
+        index = {}
+        for emotion, keywords in self.emotion_keywords.items():
+            for keyword in keywords:
+                self._add_phrase(index, keyword, ('emotion', emotion))
+        for activity in self.activity_mapping:
+            self._add_phrase(index, activity, ('activity', activity))
+
+        self.keyword_index = index
+        self._emotion_rank = {emotion: i for i, emotion in enumerate(self.emotion_keywords)}
+        self._activity_rank = {activity: i for i, activity in enumerate(self.activity_mapping)}
+
+    def _add_phrase(self, index, phrase, hit):
+        """Insert a (possibly multi-word) phrase into the trie"""
+        tokens = TOKEN_PATTERN.findall(preprocess_text(phrase))
+        if not tokens:
+            return
+        children = index
+        node = None
+        for token in tokens:
+            node = children.get(token)
+            if node is None:
+                # Each node is (children, hits) so the scan loop can unpack it cheaply
+                node = ({}, [])
+                children[token] = node
+            children = node[0]
+        if hit not in node[1]:
+            node[1].append(hit)
+
+    def scan(self, processed_text):
+        """Find every emotion and activity keyword in one pass over preprocessed text"""
+        emotions = set()
+        activities = set()
+        tokens = TOKEN_PATTERN.findall(processed_text)
+        index = self.keyword_index
+        n = len(tokens)
+
+        for start in range(n):
+            node = index.get(tokens[start])
+            pos = start + 1
+            while node is not None:
+                children, hits = node
+                for kind, label in hits:
+                    if kind == 'emotion':
+                        emotions.add(label)
+                    else:
+                        activities.add(label)
+                if pos >= n or not children:
+                    break
+                node = children.get(tokens[pos])
+                pos += 1
+
+        # Report hits in vocabulary order so results are stable across runs
+        return (
+            sorted(emotions, key=self._emotion_rank.__getitem__),
+            sorted(activities, key=self._activity_rank.__getitem__),
+        )
+
+    def _build_genre_table(self):
+        """Precompute ranked genres for every (emotion, activity) signature of size 0 or 1.
+
+        Larger signatures are ranked on first use and memoized in the same table.
+        """
+        start = time.perf_counter()
+        self._emotion_order = {emotion: i for i, emotion in enumerate(self.emotion_genre_mapping)}
+        self._activity_order = {activity: i for i, activity in enumerate(self.activity_mapping)}
+
+        table = {}
+        emotion_options = [()] + [(emotion,) for emotion in self.emotion_genre_mapping]
+        activity_options = [()] + [(activity,) for activity in self.activity_mapping]
+        for emotions in emotion_options:
+            for activities in activity_options:
+                table[(frozenset(emotions), frozenset(activities))] = self._rank_genres(emotions, activities)
+
+        self.genre_table = table
+        self.genre_table_precomputed = len(table)
+        self.genre_table_build_ms = (time.perf_counter() - start) * 1000
+
+    def _rank_genres(self, emotions, activities):
+        """Rank genres for a signature; ties go to the genre seen first in mapping order"""
+        recommended_genres = []
+        for emotion in sorted(emotions, key=self._emotion_order.__getitem__):
+            recommended_genres.extend(self.emotion_genre_mapping[emotion])
+        for activity in sorted(activities, key=self._activity_order.__getitem__):
+            recommended_genres.extend(self.activity_mapping[activity])
+
+        if not recommended_genres:
+            return DEFAULT_GENRES
+        # Counter keeps insertion order, and most_common sorts stably, so ties are deterministic
+        genre_counts = Counter(recommended_genres)
+        return tuple(genre for genre, _ in genre_counts.most_common(5))
+
+    def genre_recommendations(self, emotions, activities):
+        """Look up the ranked genres for a set of emotions and activities"""
+        signature = (
+            frozenset(emotion for emotion in emotions if emotion in self.emotion_genre_mapping),
+            frozenset(activity for activity in activities or () if activity in self.activity_mapping),
+        )
+        table = self.genre_table
+        ranked = table.get(signature)
+        if ranked is None:
+            ranked = self._rank_genres(*signature)
+            if len(table) < self.genre_table_precomputed + GENRE_TABLE_MAX:
+                table[signature] = ranked
+        return ranked
+
+    def stats(self):
+        """Describe the snapshot: version, sizes and compile timings"""
+        return {
+            'version': self.version,
+            'generation': self.generation,
+            'source': self.source,
+            'emotions': len(self.emotion_genre_mapping),
+            'keywords': sum(len(keywords) for keywords in self.emotion_keywords.values()),
+            'activities': len(self.activity_mapping),
+            'compile_ms': round(self.compile_ms, 3),
+            'genre_table': {
+                'entries': len(self.genre_table),
+                'precomputed': self.genre_table_precomputed,
+                'build_ms': round(self.genre_table_build_ms, 3),
+            },
         }
 
+
+class MusicNLPProcessor:
+    def __init__(self, cache_size=1024, cache_ttl=None, sentiment_backend=None,
+                 vocabulary_path=VOCABULARY_PATH, watch_interval=None, stage_timer=None):
+        # Emotion keywords, activity mapping and genre mapping live in a versioned data file
+        self.vocabulary_path = vocabulary_path
+        data, signature = load_vocabulary_file(vocabulary_path)
+        self._vocab = CompiledVocabulary(data, source=vocabulary_path, signature=signature)
+
+        # Seconds between checks of the vocabulary file for changes; None/0 disables watching
+        self.watch_interval = watch_interval
+        self._next_watch_check = time.monotonic() + (watch_interval or 0)
+        self._failed_signature = None
+        self._reload_lock = threading.Lock()
+
+        # Polarity source for the no-keyword fallback; TextBlob is imported lazily by default
+        self.sentiment_backend = sentiment_backend if sentiment_backend is not None else TextBlobSentiment()
+
+        # Results of process_user_message keyed on (vocabulary generation, preprocessed text)
+        self.cache = ResultCache(maxsize=cache_size, ttl=cache_ttl)
+
+        # stage_timer(name) returns a context manager timing one pipeline stage
+        self.stage_timer = stage_timer if stage_timer is not None else untimed_stage
+
+    @property
+    def emotion_genre_mapping(self):
+        return self._vocab.emotion_genre_mapping
+
+    @property
+    def emotion_keywords(self):
+        return self._vocab.emotion_keywords
+
+    @property
+    def activity_mapping(self):
+        return self._vocab.activity_mapping
+
+    @property
+    def vocabulary(self):
+        """The compiled vocabulary snapshot currently serving requests"""
+        return self._vocab
+
+    def _install_vocabulary(self, vocab):
+        """Atomically swap in a new snapshot; the read path never takes a lock"""
+        self._vocab = vocab
+        # Old entries can no longer hit (the key carries the generation); free them now
+        self.cache.clear()
+
+    def update_mappings(self, emotion_keywords=None, activity_mapping=None, emotion_genre_mapping=None):
+        """Replace any of the vocabulary mappings, recompile and drop cached results"""
+        data = self._vocab.to_data()
+        if emotion_keywords is not None:
+            data['emotion_keywords'] = emotion_keywords
+        if activity_mapping is not None:
+            data['activity_mapping'] = activity_mapping
+        if emotion_genre_mapping is not None:
+            data['emotion_genre_mapping'] = emotion_genre_mapping
+        self._install_vocabulary(CompiledVocabulary(data))
+
+    def reload_vocabulary(self, blocking=True):
+        """Reload the vocabulary file, compile it and swap it in.
+
+        Returns a stats dict with the new version and compile time, or None when
+        blocking is False and another thread is already reloading. On a bad file
+        the current vocabulary stays in place and the error is raised.
+        """
+        if not self._reload_lock.acquire(blocking):
+            return None
+        try:
+            previous = self._vocab
+            start = time.perf_counter()
+            data, signature = load_vocabulary_file(self.vocabulary_path)
+            vocab = CompiledVocabulary(data, source=self.vocabulary_path, signature=signature)
+            self._install_vocabulary(vocab)
+
+            stats = vocab.stats()
+            stats['previous_version'] = previous.version
+            stats['reload_ms'] = round((time.perf_counter() - start) * 1000, 3)
+            print(f"Vocabulary v{vocab.version} loaded in {stats['reload_ms']} ms")
+            return stats
+        finally:
+            self._reload_lock.release()
+
+    def check_vocabulary_file(self):
+        """Reload the vocabulary if its file changed; checks at most once per watch_interval"""
+        if not self.watch_interval or not self.vocabulary_path:
+            return None
+        now = time.monotonic()
+        if now < self._next_watch_check:
+            return None
+        self._next_watch_check = now + self.watch_interval
+
+        signature = None
+        try:
+            signature = file_signature(self.vocabulary_path)
+            # Skip files we already loaded, or already failed to load
+            if signature in (self._vocab.signature, self._failed_signature):
+                return None
+            return self.reload_vocabulary(blocking=False)
+        except (OSError, ValueError) as e:
+            self._failed_signature = signature
+            print(f"Vocabulary reload failed, keeping v{self._vocab.version}: {e}")
+            return None
+
+    def vocabulary_info(self):
+        """Current vocabulary stats plus result cache counters"""
+        info = self._vocab.stats()
+        info['cache'] = self.cache.stats()
+        info['sentiment_backend'] = self.sentiment_backend.name
+        return info
+
+    def set_sentiment_backend(self, backend):
+        """Swap the sentiment backend and drop results computed with the old one"""
+        self.sentiment_backend = backend
+        # A fresh snapshot gets a new generation, so no result from the old backend can hit
+        vocab = self._vocab
+        self._install_vocabulary(CompiledVocabulary(vocab.to_data(), vocab.source, vocab.signature))
+
+    def warm_up(self):
+        """Import the sentiment backend and load its lexicon ahead of the first request"""
+        self.sentiment_backend.warm_up()
+
+    def sentiment_polarity(self, text):
+        """Return the sentiment backend's polarity for text"""
+        return self.sentiment_backend.polarity(text)
+
+    def sentiment_polarities(self, texts):
+        """Return polarities for a batch of texts from the sentiment backend"""
+        return self.sentiment_backend.polarities(texts)
+
+    def genre_table_stats(self):
+        """Report the size of the genre ranking table and how long it took to build"""
+        return self._vocab.stats()['genre_table']
+
+    def scan_keywords(self, processed_text):
+        """Find every emotion and activity keyword in one pass over preprocessed text"""
+        return self._vocab.scan(processed_text)
+
     def preprocess_text(self, text):
         """Clean and normalize input text"""
-        if not isinstance(text, str):
-            return ""
-        
-        text = text.lower().strip()
-        # Remove special characters but keep spaces and handle contractions better
-        text = re.sub(r"[^\w\s']", ' ', text)
-        text = re.sub(r'\s+', ' ', text)  # Replace multiple spaces with single space
-        return text.strip()
+        return preprocess_text(text)
 
-    def extract_emotions(self, text):
-        """Extract emotions from text using keyword matching and sentiment analysis"""
+    def analyze_text(self, text):
+        """Preprocess once and return (emotions, activities) for a message"""
         if not text:
-            return []
-            
-        processed_text = self.preprocess_text(text)
-        detected_emotions = []
-        
-        # Improved keyword-based emotion detection with word boundaries
-        for emotion, keywords in self.emotion_keywords.items():
-            for keyword in keywords:
-                # Use word boundaries to avoid partial matches
-                pattern = r'\b' + re.escape(keyword) + r'\b'
-                if re.search(pattern, processed_text):
-                    detected_emotions.append(emotion)
-                    break  # Only add emotion once per category
-        
+            return [], []
+
+        return self._analyze_processed(self._vocab, preprocess_text(text), text)
+
+    def _analyze_processed(self, vocab, processed_text, text):
+        """Return (emotions, activities) for already preprocessed text"""
+        with self.stage_timer("nlp.keywords"):
+            emotions, activities = vocab.scan(processed_text)
+        return self._apply_sentiment_fallback(emotions, text), activities
+
+    def _apply_sentiment_fallback(self, detected_emotions, text):
+        """Fall back to sentiment polarity when no emotion keyword matched"""
+        if detected_emotions:
+            return detected_emotions
+
         # Sentiment analysis fallback with better thresholds
         try:
-            blob = TextBlob(text)
-            sentiment = blob.sentiment
-            
-            if not detected_emotions:
-                if sentiment.polarity > 0.2:
-                    detected_emotions.append('happy')
-                elif sentiment.polarity < -0.2:
-                    detected_emotions.append('sad')
-                else:
-                    detected_emotions.append('relaxed')
+            with self.stage_timer("nlp.sentiment"):
+                polarity = self.sentiment_polarity(text)
         except Exception as e:
             print(f"Sentiment analysis error: {e}")
-            if not detected_emotions:
-                detected_emotions.append('relaxed')
-        
-        return list(set(detected_emotions))  # Remove duplicates
+            return ['relaxed']
+
+        return self._emotions_from_polarity(polarity)
+
+    def _emotions_from_polarity(self, polarity):
+        """Map a sentiment polarity onto a fallback emotion"""
+        if polarity > 0.2:
+            return ['happy']
+        elif polarity < -0.2:
+            return ['sad']
+        return ['relaxed']
+
+    def extract_emotions(self, text):
+        """Extract emotions from text using keyword matching and sentiment analysis"""
+        if not text:
+            return []
+            
+        emotions, _ = self.analyze_text(text)
+        return emotions
 
     def extract_activities(self, text):
         """Extract activity context from text"""
         if not text:
             return []
             
-        processed_text = self.preprocess_text(text)
-        activities = []
-        
-        for activity in self.activity_mapping.keys():
-            # Use word boundaries for better matching
-            pattern = r'\b' + re.escape(activity) + r'\b'
-            if re.search(pattern, processed_text):
-                activities.append(activity)
-        
+        _, activities = self.scan_keywords(preprocess_text(text))
         return activities
 
     def get_genre_recommendations(self, emotions, activities=None):
         """Map emotions and activities to music genres from your database"""
-        recommended_genres = []
-        
-        # Primary recommendations based on emotions
-        for emotion in emotions:
-            if emotion in self.emotion_genre_mapping:
-                recommended_genres.extend(self.emotion_genre_mapping[emotion])
-        
-        # Secondary recommendations based on activities
-        if activities:
-            for activity in activities:
-                if activity in self.activity_mapping:
-                    recommended_genres.extend(self.activity_mapping[activity])
-        
-        # Remove duplicates and return top 3-5 genres
-        if recommended_genres:
-            genre_counts = Counter(recommended_genres)
-            return [genre for genre, _ in genre_counts.most_common(5)]
-        else:
-            # Fallback genres if no specific matches
-            return ['trending_music', 'top_music', 'developers_choice_music']
+        return list(self._vocab.genre_recommendations(emotions, activities))
 
     def process_user_message(self, message):
-        """Main processing function with error handling"""
+        """Main processing function with error handling.
+
+        Returns a read-only mapping. Keyword results are cached on the preprocessed
+        text; sentiment fallback results also on the raw message, which is what
+        the sentiment backend scores (preprocessing drops emoticons and punctuation).
+        """
         try:
             if not message or not isinstance(message, str):
-                return {
-                    'emotions': [],
-                    'activities': [],
-                    'recommended_genres': ['trending_music', 'top_music', 'developers_choice_music'],
-                    'confidence': 0.1
-                }
-            
-            emotions = self.extract_emotions(message)
-            activities = self.extract_activities(message)
-            genres = self.get_genre_recommendations(emotions, activities)
+                return FALLBACK_RESULT
+
+            self.check_vocabulary_file()
+            # One snapshot for the whole request, even if a reload lands mid-way
+            vocab = self._vocab
+            with self.stage_timer("nlp.preprocess"):
+                processed_text = preprocess_text(message)
+            key = (vocab.generation, processed_text)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+            with self.stage_timer("nlp.keywords"):
+                emotions, activities = vocab.scan(processed_text)
+            if not emotions:
+                key = (vocab.generation, processed_text, message)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+                emotions = self._apply_sentiment_fallback(emotions, message)
+            with self.stage_timer("nlp.genres"):
+                genres = vocab.genre_recommendations(emotions, activities)
             
-            return {
+            result = freeze_result({
                 'emotions': emotions,
                 'activities': activities,
                 'recommended_genres': genres,
                 'confidence': self.calculate_confidence(emotions, activities)
-            }
+            })
+            self.cache.put(key, result)
+            return result
         except Exception as e:
             print(f"Error processing message: {e}")
-            return {
-                'emotions': [],
-                'activities': [],
-                'recommended_genres': ['trending_music', 'top_music', 'developers_choice_music'],
-                'confidence': 0.1
-            }
+            return FALLBACK_RESULT
+
+    def process_messages(self, messages, chunk_size=256):
+        """Analyze an iterable of messages, yielding one result per message in input order.
+
+        Messages are consumed in chunks: identical messages (after preprocessing) are
+        analyzed once, cached results are reused, and the distinct messages that need
+        the sentiment fallback are passed to the backend's polarities() together
+        (the current backends still score them one text at a time).
+        """
+        chunk = []
+        for message in messages:
+            chunk.append(message)
+            if len(chunk) >= chunk_size:
+                yield from self._process_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from self._process_chunk(chunk)
+
+    def _process_chunk(self, messages):
+        """Analyze one chunk of messages for process_messages"""
+        self.check_vocabulary_file()
+        vocab = self._vocab
+        keys = []
+        results = {}
+        pending = {}
+        scans = {}
+
+        for message in messages:
+            if not message or not isinstance(message, str):
+                keys.append(None)
+                continue
+            key = (vocab.generation, preprocess_text(message))
+            if key not in results and key not in pending:
+                if key not in scans:
+                    cached = self.cache.get(key)
+                    if cached is not None:
+                        results[key] = cached
+                        keys.append(key)
+                        continue
+                    scans[key] = vocab.scan(key[1])
+                if scans[key][0]:
+                    pending[key] = (message, scans[key])
+                else:
+                    # Same keying as process_user_message: sentiment scores the raw message
+                    key = key + (message,)
+                    if key not in results and key not in pending:
+                        cached = self.cache.get(key)
+                        if cached is not None:
+                            results[key] = cached
+                        else:
+                            pending[key] = (message, scans[key[:2]])
+            keys.append(key)
+
+        # Score every message without a keyword hit in one batch
+        needs_sentiment = [key for key, (_, (emotions, _)) in pending.items() if not emotions]
+        polarities = {}
+        if needs_sentiment:
+            try:
+                with self.stage_timer("nlp.sentiment"):
+                    scores = self.sentiment_polarities([pending[key][0] for key in needs_sentiment])
+                polarities = dict(zip(needs_sentiment, scores))
+            except Exception as e:
+                print(f"Sentiment analysis error: {e}")
+
+        for key, (_, (emotions, activities)) in pending.items():
+            if not emotions:
+                polarity = polarities.get(key)
+                emotions = self._emotions_from_polarity(polarity) if polarity is not None else ['relaxed']
+            result = freeze_result({
+                'emotions': emotions,
+                'activities': activities,
+                'recommended_genres': vocab.genre_recommendations(emotions, activities),
+                'confidence': self.calculate_confidence(emotions, activities)
+            })
+            results[key] = result
+            self.cache.put(key, result)
+
+        for key in keys:
+            yield FALLBACK_RESULT if key is None else results[key]
 
     def calculate_confidence(self, emotions, activities):
         """Calculate confidence score for recommendations"""
@@ -0,0 +1,122 @@
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+
+def _frame_label(code):
+    path = code.co_filename.replace("\\", "/").split("/")
+    location = "/".join(path[-2:])
+    return f"{code.co_name} ({location}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """Samples every thread's stack in a background thread and counts collapsed stacks.
+
+    The result is Brendan Gregg's collapsed format ("root;caller;callee count"
+    per line), which flamegraph.pl, speedscope and inferno read directly.
+    Running in its own thread, it also sees the main thread of a sync worker
+    while that thread is serving other requests.
+    """
+
+    def __init__(self):
+        self.result = None
+        self.session = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds, interval):
+        """Start sampling for seconds at interval; False if a session is already running"""
+        with self._lock:
+            if self.running:
+                return False
+            self.session = {"started_at": time.time(), "seconds": seconds, "interval": interval}
+            self._thread = threading.Thread(
+                target=self._run, args=(seconds, interval), name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def _run(self, seconds, interval):
+        own_id = threading.get_ident()
+        names = {}
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, f"thread-{thread_id}"))
+                stacks[";".join(reversed(labels))] += 1
+            samples += 1
+            time.sleep(interval)
+
+        lines = [f"{stack} {count}" for stack, count in stacks.most_common()]
+        self.result = "\n".join(lines) + "\n" if lines else ""
+        self.session = dict(self.session, samples=samples, finished_at=time.time())
+
+    def status(self):
+        return {"pid": os.getpid(), "running": self.running, "session": self.session}
+
+
+class RequestProfiler:
+    """Runs cProfile around a single request when an authorized caller asks for it.
+
+    "X-Profile: cprofile" replaces the response body with pstats text sorted by
+    cumulative time; "X-Profile: pstats" returns the raw stats dump, which
+    pstats, snakeviz and flameprof load. authorized() decides who may ask.
+    """
+
+    def __init__(self, app, authorized, sort="cumulative", limit=60):
+        self.authorized = authorized
+        self.sort = sort
+        self.limit = limit
+        self.app = app
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self):
+        mode = request.headers.get("X-Profile")
+        if mode not in ("cprofile", "pstats") or not self.authorized():
+            return
+        g.profile_mode = mode
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+    def _after_request(self, response):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        stats = pstats.Stats(profiler)
+
+        if g.profile_mode == "pstats":
+            body = marshal.dumps(stats.stats)
+            profiled = self.app.response_class(body, mimetype="application/octet-stream")
+            profiled.headers["Content-Disposition"] = "attachment; filename=request.prof"
+        else:
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats(self.sort).print_stats(self.limit)
+            profiled = self.app.response_class(out.getvalue(), mimetype="text/plain")
+        profiled.headers["X-Profiled-Status"] = str(response.status_code)
+        response.close()
+        return profiled
@@ -0,0 +1,152 @@
+import os
+import re
+from array import array
+
+# Default lexicon shipped with the repo: one "word<TAB>polarity" pair per line
+LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sentiment_lexicon.tsv")
+
+WORD_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+# Words that flip the polarity of the next sentiment word (pattern/TextBlob uses -0.5)
+NEGATIONS = frozenset([
+    'not', 'no', 'never', 'nothing', 'hardly', 'without', 'neither', 'nor',
+    "don't", 'dont', "doesn't", 'doesnt', "didn't", 'didnt', "isn't", 'isnt',
+    "wasn't", 'wasnt', "aren't", 'arent', "can't", 'cant', "won't", 'wont',
+    "couldn't", "wouldn't", "shouldn't", "ain't",
+])
+NEGATION_FACTOR = -0.5
+NEGATION_SCOPE = 3
+
+# Multipliers applied to the sentiment word that directly follows them
+INTENSIFIERS = {
+    'very': 1.3, 'really': 1.3, 'so': 1.3, 'super': 1.3, 'totally': 1.3,
+    'extremely': 1.5, 'incredibly': 1.5, 'absolutely': 1.4, 'too': 1.2,
+    'quite': 1.1, 'slightly': 0.5, 'somewhat': 0.7,
+    'kinda': 0.7, 'bit': 0.6,
+}
+
+
+class SentimentBackend:
+    """Interface for the polarity source behind MusicNLPProcessor's fallback"""
+
+    name = "base"
+
+    def warm_up(self):
+        """Load whatever the backend needs ahead of the first request"""
+        self.polarity("warm up")
+
+    def polarity(self, text):
+        """Return a polarity in [-1.0, 1.0] for text"""
+        raise NotImplementedError
+
+    def polarities(self, texts):
+        """Return polarities for a batch of texts"""
+        return [self.polarity(text) for text in texts]
+
+
+class TextBlobSentiment(SentimentBackend):
+    """TextBlob's PatternAnalyzer, imported lazily on first use"""
+
+    name = "textblob"
+
+    def __init__(self):
+        # TextBlob (and nltk under it) is imported on first use so worker boot stays cheap
+        self._textblob = None
+
+    def polarity(self, text):
+        if self._textblob is None:
+            from textblob import TextBlob
+            self._textblob = TextBlob
+        return self._textblob(text).sentiment.polarity
+
+
+class LexiconSentiment(SentimentBackend):
+    """Word-level lexicon scorer with simple negation and intensifier handling.
+
+    The lexicon is loaded once into a word -> slot table and a flat float array.
+    Polarity is the mean of the (adjusted) scores of the sentiment words found,
+    which mirrors how TextBlob aggregates its own lexicon.
+    """
+
+    name = "lexicon"
+
+    def __init__(self, path=LEXICON_PATH):
+        self.path = path
+        self._slots = None
+        self._scores = None
+
+    def load(self):
+        """Read the lexicon file into the slot table and score array"""
+        slots = {}
+        scores = array('d')
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                word, score = line.split('\t')
+                slots[word] = len(scores)
+                scores.append(float(score))
+        self._scores = scores
+        self._slots = slots
+
+    def warm_up(self):
+        if self._slots is None:
+            self.load()
+
+    def __len__(self):
+        self.warm_up()
+        return len(self._scores)
+
+    def polarity(self, text):
+        if self._slots is None:
+            self.load()
+        slots = self._slots
+        scores = self._scores
+
+        total = 0.0
+        count = 0
+        multiplier = 1.0
+        negate_for = 0
+        for word in WORD_PATTERN.findall(text.lower()):
+            if word in NEGATIONS:
+                negate_for = NEGATION_SCOPE
+                multiplier = 1.0
+                continue
+
+            intensity = INTENSIFIERS.get(word)
+            if intensity is not None:
+                multiplier *= intensity
+                continue
+
+            slot = slots.get(word)
+            if slot is None:
+                negate_for = max(negate_for - 1, 0)
+                multiplier = 1.0
+                continue
+
+            score = scores[slot] * multiplier
+            if negate_for:
+                score *= NEGATION_FACTOR
+            total += score
+            count += 1
+            multiplier = 1.0
+            negate_for = 0
+
+        if not count:
+            return 0.0
+        return max(-1.0, min(1.0, total / count))
+
+
+SENTIMENT_BACKENDS = {
+    TextBlobSentiment.name: TextBlobSentiment,
+    LexiconSentiment.name: LexiconSentiment,
+}
+
+
+def get_sentiment_backend(name):
+    """Instantiate a sentiment backend by name ('textblob' or 'lexicon')"""
+    try:
+        return SENTIMENT_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown sentiment backend: {name}")
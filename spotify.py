@@ -1,9 +1,12 @@
-from flask import Blueprint, redirect, request, session, jsonify
+from flask import Blueprint, Response, redirect, request, session, jsonify
 import requests
 import time
 import os
 import base64
 from dotenv import load_dotenv
+from spotify_client import SpotifyClient
+from token_store import DEFAULT_TOKEN_PATH, SharedTokenStore
+from library_cache import LibraryCache, user_cache_key
 
 load_dotenv()
 
@@ -14,11 +17,33 @@ CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI")
 AUTH_URL = "https://accounts.spotify.com/authorize"
 
-# Caching for client credentials flow
-access_token_cache = {"access_token": None, "expires_at": 0}
+# Pooled keep-alive session with timeouts, shared by every route in this worker
+spotify_client = SpotifyClient.from_env()
 
-def refresh_token():
-    auth_response = requests.post(
+# User access tokens are refreshed once they are this close (seconds) to expiring
+TOKEN_REFRESH_WINDOW = int(os.getenv("SPOTIFY_TOKEN_REFRESH_WINDOW", 60))
+
+# Library pages (/me/albums, /me/artists, ...) per user, revalidated upstream with ETags
+library_cache = LibraryCache(
+    ttl=float(os.getenv("SPOTIFY_LIBRARY_CACHE_TTL", 60)),
+    max_bytes=int(os.getenv("SPOTIFY_LIBRARY_CACHE_BYTES", 16 * 1024 * 1024)),
+)
+
+
+@spotify.errorhandler(requests.exceptions.Timeout)
+def spotify_timeout(e):
+    print(f"Spotify request timed out: {e}")
+    return jsonify({"error": "Spotify did not respond in time", "details": str(e)}), 504
+
+
+@spotify.errorhandler(requests.exceptions.ConnectionError)
+def spotify_unreachable(e):
+    print(f"Spotify connection failed: {e}")
+    return jsonify({"error": "Could not reach Spotify", "details": str(e)}), 502
+
+def fetch_client_token():
+    """Client credentials grant: return (access_token, expires_in)"""
+    auth_response = spotify_client.post(
         "https://accounts.spotify.com/api/token",
         data={"grant_type": "client_credentials"},
         auth=(CLIENT_ID, CLIENT_SECRET),
@@ -27,17 +52,18 @@ def refresh_token():
         raise Exception("Failed to get token: " + auth_response.text)
 
     token_data = auth_response.json()
-    access_token_cache["access_token"] = token_data["access_token"]
-    access_token_cache["expires_at"] = time.time() + token_data["expires_in"] - 60
+    return token_data["access_token"], token_data["expires_in"]
+
+# Client credentials token shared by all workers on this host, refreshed in the background
+client_token_store = SharedTokenStore(
+    fetch_client_token,
+    path=os.getenv("SPOTIFY_TOKEN_STORE_PATH", DEFAULT_TOKEN_PATH),
+    refresh_margin=int(os.getenv("SPOTIFY_TOKEN_REFRESH_MARGIN", 300)),
+)
 
 @spotify.route("/token")
 def get_token():
-    if (
-        not access_token_cache["access_token"]
-        or time.time() > access_token_cache["expires_at"]
-    ):
-        refresh_token()
-    return jsonify({"access_token": access_token_cache["access_token"]})
+    return jsonify({"access_token": client_token_store.get()})
 
 @spotify.route("/login")
 def login():
@@ -78,23 +104,27 @@ def callback():
     }
 
     try:
-        res = requests.post(token_url, data=payload, headers=headers)
+        res = spotify_client.post(token_url, data=payload, headers=headers)
         res.raise_for_status()
         tokens = res.json()
 
-        session["access_token"] = tokens.get("access_token")
-        session["refresh_token"] = tokens.get("refresh_token")
+        store_user_tokens(tokens)
         return jsonify(tokens)
     except requests.exceptions.RequestException as e:
         print(f"Spotify token exchange failed: {e}")
         return jsonify({"error": "Token exchange failed", "details": str(e)}), 500
 
-@spotify.route("/refresh_access_token")
-def refresh_access_token():
-    refresh_token = session.get("refresh_token")
-    if not refresh_token:
-        return jsonify({"error": "No refresh token found"}), 400
+def store_user_tokens(tokens):
+    """Keep a token response in the session, with the access token's absolute expiry"""
+    session["access_token"] = tokens.get("access_token")
+    session["expires_at"] = time.time() + tokens.get("expires_in", 3600)
+    # Spotify only sometimes rotates the refresh token
+    if tokens.get("refresh_token"):
+        session["refresh_token"] = tokens["refresh_token"]
+
 
+def request_token_refresh(refresh_token):
+    """Exchange a refresh token for a new access token at the accounts service"""
     token_url = "https://accounts.spotify.com/api/token"
     payload = {
         "grant_type": "refresh_token",
@@ -107,25 +137,71 @@ def refresh_access_token():
         "Content-Type": "application/x-www-form-urlencoded",
     }
 
+    res = spotify_client.post(token_url, data=payload, headers=headers)
+    res.raise_for_status()
+    return res.json()
+
+
+def refresh_user_token():
+    """Refresh the session's access token now; True on success"""
+    refresh_token = session.get("refresh_token")
+    if not refresh_token:
+        return False
     try:
-        res = requests.post(token_url, data=payload, headers=headers)
-        res.raise_for_status()
-        tokens = res.json()
-        session["access_token"] = tokens["access_token"]
+        store_user_tokens(request_token_refresh(refresh_token))
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"[ERROR] Failed to refresh token: {e}")
+        return False
+
+
+@spotify.route("/refresh_access_token")
+def refresh_access_token():
+    refresh_token = session.get("refresh_token")
+    if not refresh_token:
+        return jsonify({"error": "No refresh token found"}), 400
+
+    try:
+        tokens = request_token_refresh(refresh_token)
+        store_user_tokens(tokens)
         return jsonify({"access_token": tokens["access_token"]})
     except requests.exceptions.RequestException as e:
         print(f"[ERROR] Failed to refresh token: {e}")
         return jsonify({"error": "Failed to refresh token", "details": str(e)}), 500
 
 def refresh_access_token_if_expired():
+    """Make sure the session holds a usable access token, refreshing only near its expiry"""
     if not session.get("refresh_token"):
         return False
-    try:
-        response = refresh_access_token()
-        return response.status_code == 200
-    except Exception as e:
-        print("[ERROR] Auto-refresh failed:", e)
-        return False
+    expires_at = session.get("expires_at", 0)
+    if session.get("access_token") and time.time() < expires_at - TOKEN_REFRESH_WINDOW:
+        return True
+    return refresh_user_token()
+
+def spotify_api(method, url, headers=None, **kwargs):
+    """Call the Web API as the session's user, refreshing the token and retrying once on a 401"""
+    headers = dict(headers or {})
+    headers["Authorization"] = f"Bearer {session.get('access_token')}"
+    res = spotify_client.request(method, url, headers=headers, **kwargs)
+    if res.status_code == 401 and refresh_user_token():
+        headers["Authorization"] = f"Bearer {session.get('access_token')}"
+        res = spotify_client.request(method, url, headers=headers, **kwargs)
+    return res
+
+def spotify_api_gather(calls):
+    """spotify_api for independent (method, url) calls, run concurrently under one deadline.
+
+    The session is only touched here, in the request thread: a 401 from any
+    call refreshes the token once and re-runs the whole batch.
+    """
+    def batch():
+        headers = {"Authorization": f"Bearer {session.get('access_token')}"}
+        return spotify_client.gather([(method, url, {"headers": headers}) for method, url in calls])
+
+    responses = batch()
+    if any(res.status_code == 401 for res in responses) and refresh_user_token():
+        responses = batch()
+    return responses
 
 @spotify.route("/me")
 def get_profile():
@@ -133,12 +209,13 @@ def get_profile():
         return jsonify({"error": "No access token in session"}), 401
 
     refresh_access_token_if_expired()
-    token = session.get("access_token")
-    headers = {"Authorization": f"Bearer {token}"}
 
     try:
-        profile_response = requests.get("https://api.spotify.com/v1/me", headers=headers)
-        playlists_response = requests.get("https://api.spotify.com/v1/me/playlists", headers=headers)
+        # Independent calls: fetched concurrently, so /me costs about the slower of the two
+        profile_response, playlists_response = spotify_api_gather([
+            ("GET", "https://api.spotify.com/v1/me"),
+            ("GET", "https://api.spotify.com/v1/me/playlists"),
+        ])
 
         if profile_response.status_code != 200:
             return jsonify({"error": "Failed to fetch profile", "details": profile_response.text}), 400
@@ -159,6 +236,9 @@ def get_profile():
             },
             "playlists": playlists
         })
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+        # Left to the blueprint's 504/502 handlers
+        raise
     except requests.exceptions.RequestException as e:
         return jsonify({"error": "Failed to fetch user data", "details": str(e)}), 400
 
@@ -173,7 +253,7 @@ def create_playlist():
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
     
     # FIX: Add error handling
-    profile_response = requests.get("https://api.spotify.com/v1/me", headers=headers)
+    profile_response = spotify_api("GET", "https://api.spotify.com/v1/me", headers=headers)
     if profile_response.status_code != 200:
         return jsonify({"error": "Failed to fetch profile"}), 400
         
@@ -196,7 +276,7 @@ def get_player_devices():
 
     token = session.get("access_token")
     headers = {"Authorization": f"Bearer {token}"}
-    res = requests.get("https://api.spotify.com/v1/me/player/devices", headers=headers)
+    res = spotify_api("GET", "https://api.spotify.com/v1/me/player/devices", headers=headers)
 
     if res.status_code != 200:
         return jsonify({"error": "Failed to fetch devices", "details": res.text}), 400
@@ -235,11 +315,13 @@ def play_track():
     if device_id:
         url += f"?device_id={device_id}"
 
-    res = requests.put(url, headers=headers, json=payload)
+    res = spotify_api("PUT", url, headers=headers, json=payload)
 
     if res.status_code != 204:
         return jsonify({"error": "Failed to play track", "details": res.text}), 400
 
+    library_cache.invalidate(library_user_key())
+
     return jsonify({"status": "playing"})
 
 @spotify.route("/player/state")
@@ -249,7 +331,7 @@ def get_current_playback():
 
     token = session.get("access_token")
     headers = {"Authorization": f"Bearer {token}"}
-    res = requests.get("https://api.spotify.com/v1/me/player", headers=headers)
+    res = spotify_api("GET", "https://api.spotify.com/v1/me/player", headers=headers)
 
     if res.status_code != 200:
         return jsonify({"error": "Failed to fetch playback state", "details": res.text}), 400
@@ -271,7 +353,8 @@ def transfer_playback():
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
     payload = {"device_ids": device_ids, "play": True}
 
-    res = requests.put(
+    res = spotify_api(
+        "PUT",
         "https://api.spotify.com/v1/me/player",
         headers=headers,
         json=payload,
@@ -296,7 +379,8 @@ def set_repeat():
         return jsonify({"error": "Invalid repeat mode"}), 400
 
     headers = {"Authorization": f"Bearer {token}"}
-    res = requests.put(
+    res = spotify_api(
+        "PUT",
         f"https://api.spotify.com/v1/me/player/repeat?state={state}&device_id={device_id}",
         headers=headers,
     )
@@ -320,7 +404,8 @@ def set_shuffle():
         return jsonify({"error": "Missing 'state' (true/false)"}), 400
 
     headers = {"Authorization": f"Bearer {token}"}
-    res = requests.put(
+    res = spotify_api(
+        "PUT",
         f"https://api.spotify.com/v1/me/player/shuffle?state={str(state).lower()}&device_id={device_id}",
         headers=headers,
     )
@@ -337,7 +422,7 @@ def get_queue():
 
     token = session.get("access_token")
     headers = {"Authorization": f"Bearer {token}"}
-    res = requests.get("https://api.spotify.com/v1/me/player/queue", headers=headers)
+    res = spotify_api("GET", "https://api.spotify.com/v1/me/player/queue", headers=headers)
 
     if res.status_code != 200:
         return jsonify({"error": "Failed to fetch queue", "details": res.text}), 400
@@ -358,7 +443,8 @@ def add_to_queue():
         return jsonify({"error": "Missing track URI"}), 400
 
     headers = {"Authorization": f"Bearer {token}"}
-    res = requests.post(
+    res = spotify_api(
+        "POST",
         f"https://api.spotify.com/v1/me/player/queue?uri={uri}&device_id={device_id}",
         headers=headers
     )
@@ -366,9 +452,55 @@ def add_to_queue():
     if res.status_code != 204:
         return jsonify({"error": "Failed to add to queue", "details": res.text}), 400
 
+    library_cache.invalidate(library_user_key())
+
     return jsonify({"status": "track queued", "uri": uri})
 
 
+def library_user_key():
+    """Cache namespace of the session's user; the refresh token outlives access tokens"""
+    secret = session.get("refresh_token") or session.get("access_token")
+    return user_cache_key(secret) if secret else None
+
+
+def spotify_library_get(url):
+    """GET a library page through the per-user cache; returns (raw JSON bytes, upstream response, cache status).
+
+    A fresh entry is served without calling Spotify; a stale one is revalidated
+    with If-None-Match, so unchanged data only costs a 304. The body is None
+    when Spotify answered with an error.
+    """
+    user = library_user_key()
+    entry, fresh = library_cache.lookup(user, url) if user else (None, False)
+    if fresh:
+        return entry.body, None, "HIT"
+
+    headers = {"If-None-Match": entry.etag} if entry is not None and entry.etag else None
+    res = spotify_api("GET", url, headers=headers)
+    # A 401 retry inside spotify_api may have rotated the refresh token the key is derived from
+    current_user = library_user_key()
+    if res.status_code == 304 and entry is not None:
+        if current_user == user:
+            library_cache.revalidated_entry(user, url)
+        elif current_user:
+            library_cache.put(current_user, url, entry.body, entry.etag, entry.size)
+        return entry.body, res, "REVALIDATED"
+    if res.status_code != 200:
+        return None, res, "MISS"
+
+    # The raw bytes are cached and served as-is: the memory bound is their real size
+    body = res.content
+    if current_user:
+        library_cache.put(current_user, url, body, res.headers.get("ETag"), len(body))
+    return body, res, "MISS"
+
+
+def library_response(body, cache_status):
+    response = Response(body, mimetype="application/json")
+    response.headers["X-Cache"] = cache_status
+    return response
+
+
 # Helper
 def get_spotify_headers():
     refresh_access_token_if_expired()
@@ -388,12 +520,12 @@ def get_saved_albums():
     offset = request.args.get("offset", 0)
 
     url = f"https://api.spotify.com/v1/me/albums?limit={limit}&offset={offset}"
-    res = requests.get(url, headers=headers)
+    body, res, cache_status = spotify_library_get(url)
 
-    if res.status_code != 200:
+    if body is None:
         return jsonify({"error": "Failed to fetch albums", "details": res.text}), 400
 
-    return jsonify(res.json())
+    return library_response(body, cache_status)
 
 
 @spotify.route("/me/artists")
@@ -409,12 +541,12 @@ def get_followed_artists():
     if after:
         url += f"&after={after}"
 
-    res = requests.get(url, headers=headers)
+    body, res, cache_status = spotify_library_get(url)
 
-    if res.status_code != 200:
+    if body is None:
         return jsonify({"error": "Failed to fetch followed artists", "details": res.text}), 400
 
-    return jsonify(res.json())
+    return library_response(body, cache_status)
 
 
 @spotify.route("/me/shows")
@@ -427,12 +559,12 @@ def get_saved_shows():
     offset = request.args.get("offset", 0)
 
     url = f"https://api.spotify.com/v1/me/shows?limit={limit}&offset={offset}"
-    res = requests.get(url, headers=headers)
+    body, res, cache_status = spotify_library_get(url)
 
-    if res.status_code != 200:
+    if body is None:
         return jsonify({"error": "Failed to fetch saved shows", "details": res.text}), 400
 
-    return jsonify(res.json())
+    return library_response(body, cache_status)
 
 
 @spotify.route("/me/playlists")
@@ -445,10 +577,10 @@ def get_user_playlists():
     offset = request.args.get("offset", 0)
 
     url = f"https://api.spotify.com/v1/me/playlists?limit={limit}&offset={offset}"
-    res = requests.get(url, headers=headers)
+    body, res, cache_status = spotify_library_get(url)
 
-    if res.status_code != 200:
+    if body is None:
         return jsonify({"error": "Failed to fetch playlists", "details": res.text}), 400
 
-    return jsonify(res.json())
+    return library_response(body, cache_status)
 
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import metrics
+
+
+class SpotifyClient:
+    """One pooled, keep-alive requests.Session per worker for api/accounts.spotify.com.
+
+    The session is created lazily and again after a fork, so workers forked
+    from a preloaded app never share sockets. Every call gets (connect, read)
+    timeouts unless it passes its own, and is timed as the "spotify" stage.
+    """
+
+    def __init__(self, pool_maxsize=16, connect_timeout=3.05, read_timeout=10.0, connect_retries=1,
+                 fanout_workers=8, fanout_deadline=10.0):
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.connect_retries = connect_retries
+        self.fanout_workers = fanout_workers
+        self.fanout_deadline = fanout_deadline
+        self._session = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            pool_maxsize=int(os.getenv("SPOTIFY_POOL_MAXSIZE", 16)),
+            connect_timeout=float(os.getenv("SPOTIFY_CONNECT_TIMEOUT", 3.05)),
+            read_timeout=float(os.getenv("SPOTIFY_READ_TIMEOUT", 10)),
+            connect_retries=int(os.getenv("SPOTIFY_CONNECT_RETRIES", 1)),
+            fanout_workers=int(os.getenv("SPOTIFY_FANOUT_WORKERS", 8)),
+            fanout_deadline=float(os.getenv("SPOTIFY_FANOUT_DEADLINE", 10)),
+        )
+
+    def _new_session(self):
+        session = requests.Session()
+        # Only retry failed connects: nothing reached Spotify, so even a POST is safe to resend
+        retry = Retry(total=self.connect_retries, connect=self.connect_retries, read=0, status=0, redirect=0)
+        # One pool per host (api + accounts), each keeping up to pool_maxsize sockets alive
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_maxsize, max_retries=retry)
+        session.mount("https://", adapter)
+        return session
+
+    def _ensure_current_process(self):
+        """(Re)create the session and fan-out pool on first use and after a fork"""
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._new_session()
+                    # Bounded, so one slow request can't start unlimited threads
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.fanout_workers, thread_name_prefix="spotify-fanout"
+                    )
+                    self._pid = pid
+
+    @property
+    def session(self):
+        self._ensure_current_process()
+        return self._session
+
+    @property
+    def executor(self):
+        self._ensure_current_process()
+        return self._executor
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        with metrics.stage("spotify"):
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def gather(self, calls, deadline=None):
+        """Send independent requests concurrently and return their responses in order.
+
+        calls are (method, url, kwargs) tuples sharing one deadline in seconds:
+        each call's timeouts are capped by the time left, and the batch raises
+        requests.exceptions.Timeout once it is spent. The first failure cancels
+        the calls that have not started yet and is re-raised.
+        """
+        deadline = deadline if deadline is not None else self.fanout_deadline
+        end = time.monotonic() + deadline
+
+        def send(method, url, kwargs):
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise requests.exceptions.Timeout("Deadline passed before the call started")
+            kwargs = dict(kwargs)
+            kwargs.setdefault("timeout", tuple(min(limit, remaining) for limit in self.timeout))
+            return self.request(method, url, **kwargs)
+
+        futures = [self.executor.submit(send, method, url, kwargs) for method, url, kwargs in calls]
+        try:
+            done, pending = wait(futures, timeout=deadline, return_when=FIRST_EXCEPTION)
+            for future in futures:
+                if future in done and future.exception() is not None:
+                    raise future.exception()
+            if pending:
+                raise requests.exceptions.Timeout(f"Spotify calls did not finish within {deadline}s")
+            return [future.result() for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._session = None
+            self._executor = None
@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+import time
+
+# fcntl is POSIX-only: without it the token is still single-flight within a worker,
+# but each worker keeps its own copy
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Flask's instance folder next to the app, not the world-writable temp directory
+DEFAULT_TOKEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "spotify-token.json")
+
+
+def private_directory(path):
+    """Create path's directory (mode 0700) if needed; True if it is ours and nobody else can write to it"""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        st = os.stat(directory)
+    except OSError as e:
+        print(f"Token store directory {directory} is unusable: {e}")
+        return False
+    return st.st_uid == os.getuid() and not st.st_mode & 0o022
+
+
+class SharedTokenStore:
+    """Access token shared by every worker on the host through a file-locked JSON file.
+
+    fetch() returns (access_token, expires_in). A worker only calls it while
+    holding an exclusive lock on the lock file, after re-reading the token
+    file, so one refresh serves all workers. A background thread per worker
+    refreshes refresh_margin seconds ahead of expiry, so get() normally just
+    returns the in-memory copy without blocking on Spotify.
+
+    The file is only shared from a directory no other user can write to, and
+    only trusted if this user owns it and nobody else can read it; otherwise
+    each worker keeps its own token.
+    """
+
+    # Tokens this close to expiry are not handed out any more
+    EXPIRY_SKEW = 30
+
+    def __init__(self, fetch, path=DEFAULT_TOKEN_PATH, refresh_margin=300, check_interval=30):
+        self.fetch = fetch
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.refresh_margin = refresh_margin
+        self.check_interval = check_interval
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self._token = None
+        self._lock = threading.Lock()
+        self._refresher_pid = None
+        self.shared = fcntl is not None and private_directory(path)
+        if fcntl is not None and not self.shared:
+            print(f"Token store {path} is not in a private directory; keeping the token per worker")
+
+    def get(self):
+        """Return a usable access token, fetching one only if no worker has a valid token"""
+        self._ensure_refresher()
+        token = self._token
+        if token is None or not self._usable(token, self.EXPIRY_SKEW):
+            token = self._refresh(self.EXPIRY_SKEW)
+        return token["access_token"]
+
+    def invalidate(self):
+        """Drop the token everywhere, e.g. after Spotify rejected it"""
+        with self._lock, self._file_lock():
+            self._token = None
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        token = self._token
+        return {
+            "pid": os.getpid(),
+            "path": self.path,
+            "expires_in": round(token["expires_at"] - time.time(), 1) if token else None,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "shared": self.shared,
+        }
+
+    @staticmethod
+    def _usable(token, min_remaining):
+        return token["expires_at"] - time.time() > min_remaining
+
+    def _refresh(self, min_remaining):
+        """Return a token valid for min_remaining more seconds, fetching it single-flight"""
+        with self._lock:
+            # Another thread in this worker may have refreshed while we waited
+            token = self._token
+            if token is not None and self._usable(token, min_remaining):
+                return token
+            with self._file_lock():
+                # ...or another worker
+                token = self._read_file()
+                if token is None or not self._usable(token, min_remaining):
+                    access_token, expires_in = self.fetch()
+                    token = {"access_token": access_token, "expires_at": time.time() + expires_in}
+                    self._write_file(token)
+                    self.refreshes += 1
+            self._token = token
+            return token
+
+    def _file_lock(self):
+        return _FileLock(self.lock_path if self.shared else None)
+
+    def _read_file(self):
+        if not self.shared:
+            return None
+        try:
+            fd = os.open(self.path, os.O_RDONLY | os.O_NOFOLLOW)
+            with os.fdopen(fd) as f:
+                st = os.fstat(f.fileno())
+                if st.st_uid != os.getuid() or st.st_mode & 0o077:
+                    print(f"Ignoring token file {self.path}: not owned by us or readable by others")
+                    return None
+                token = json.load(f)
+            if isinstance(token.get("access_token"), str) and isinstance(token.get("expires_at"), (int, float)):
+                return token
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Ignoring unreadable token file {self.path}: {e}")
+        return None
+
+    def _write_file(self, token):
+        if not self.shared:
+            return
+        # Write to a private temp file and rename, so readers never see half a token
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(token, f)
+        os.replace(tmp_path, self.path)
+
+    def _ensure_refresher(self):
+        """Start this worker's background refresher (again after a fork)"""
+        pid = os.getpid()
+        if self._refresher_pid == pid:
+            return
+        with self._lock:
+            if self._refresher_pid == pid:
+                return
+            self._refresher_pid = pid
+            threading.Thread(target=self._refresh_loop, name="token-refresher", daemon=True).start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.check_interval)
+            token = self._token
+            if token is None or self._usable(token, self.refresh_margin):
+                continue
+            try:
+                self._refresh(self.refresh_margin)
+            except Exception as e:
+                self.refresh_errors += 1
+                print(f"Background token refresh failed: {e}")
+
+
+class _FileLock:
+    """Exclusive flock on path for the duration of a with block (no-op when path is None)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        if self.path is not None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None